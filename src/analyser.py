@@ -2,23 +2,46 @@
 
 """
 This is the Japanese Novel Analyser.
-It reads in novels from files in aozora formatting, strips this formatting,
-invokes the mecab morphological analysis and counts word frequencies.
+It reads in novels from files in aozora formatting, also inside zip
+archives, strips this formatting, invokes the mecab morphological
+analysis and counts word frequencies.
 Then it stores them in a database for later use. Repeated invokations
 add to the existing frequencies, unless the switch --droptable is given.
+Files which were analysed before are skipped, or re-analysed replacing
+their previous counts if they changed or their analysis was interrupted.
 
 Usage: analyser.py [OPTION]... FILE..
 Read and analyse each FILE.
 
 Options:
   -h, --help          Display this help
-  -e, --encoding=ENC  Set the encoding for the files to ENC
+  -e, --encoding=ENC  Set the encoding for the files to ENC; by default
+                      it is detected for each file
   -r, --recursive     Read files in all folders recursively
   -t, --tablename     Table to use (will be created if not existing)
   -f, --format=FORMAT Set the format of the files;
                       FORMAT is  'plain', 'aozora' or 'html`
   -d, --droptable     Drop table before creating and filling it
   -s, --sentences     Also collect reference sentences
+  -g, --ngrams        Also count bigrams and trigrams of root forms
+  -b, --buffer=N      Keep counts of up to N distinct words in memory
+                      before writing them to the database
+  -a, --approximate=K Count approximately with memory for 2K words and
+                      store only the K most frequent ones; each stored
+                      count is lower than the exact one by at most the
+                      reported error, which is at most N/(K+1) for N words
+  -j, --jobs=N        Analyse files in N parallel processes
+  -c, --parse-cache   Keep the results of tokenizing in a file, so that
+                      lines are not tokenized again in later runs with
+                      the same mecab dictionary
+  -o, --output=FILE   Write the sentences and their words to FILE
+                      as JSON lines instead of using the database
+  -n, --dry-run       Only tokenize the files and report the speed
+  -p, --profile=FILE  Report the time spent in each stage of the analysis
+                      for every file, and write it to FILE as JSON
+  -P, --profile-slowest=N
+                      With --profile, also profile the N slowest files
+                      with cProfile, writing to FILE.1.prof and so on
 """
 
 import sys
@@ -27,11 +50,11 @@ import codecs
 import os.path
 import sqlite3
 import re
+import time
 
-import formats
-import mecab
-import freq
+import pipeline
 import database
+import profiler
 import config
 from logger import logger
 
@@ -39,7 +62,7 @@ def main():
   basedir = config.get_basedir()
   # parse command line options
   try:
-    opts, args = getopt.getopt(sys.argv[1:], 'hf:e:o:rdt:s', ['help','format=','encoding=', 'droptable', 'recursive', 'tablename=', 'sentences'])
+    opts, args = getopt.getopt(sys.argv[1:], 'hf:e:o:rdt:sgb:a:j:cnp:P:', ['help','format=','encoding=', 'droptable', 'recursive', 'tablename=', 'sentences', 'ngrams', 'buffer=', 'approximate=', 'jobs=', 'parse-cache', 'output=', 'dry-run', 'profile=', 'profile-slowest='])
   except getopt.error as opterr:
     logger.err(opterr)
     logger.err('for help use --help')
@@ -51,6 +74,15 @@ def main():
   drop = False
   recursive = False
   sentences = False
+  ngrams = False
+  word_buffer = config.word_buffer
+  approximate = 0
+  jobs = 1
+  cachefile = None
+  output = None
+  dryrun = False
+  profilefile = None
+  slowest = 0
   for o, a in opts:
     if o in ('-h', '--help'):
       logger.out(__doc__)
@@ -63,7 +95,8 @@ def main():
     if o in ('-e', '--encoding'):
       encoding = a
       try:
-        codecs.lookup(encoding)
+        if encoding != 'auto':
+          codecs.lookup(encoding)
       except LookupError:
         logger.err('encoding not found: %s' % encoding)
         sys.exit(2)
@@ -71,6 +104,8 @@ def main():
       drop = True
     if o in ('-s', '--sentences'):
       sentences = True
+    if o in ('-g', '--ngrams'):
+      ngrams = True
     if o in ('-t', '--tablename'):
       tablename = a
       if not re.match(r'^[_a-zA-Z][_a-zA-Z0-9]*$', tablename):
@@ -78,50 +113,114 @@ def main():
         sys.exit(2)
     if o in ('-r', '--recursive'):
       recursive = True
-  # create formatter and parser
-  if(formatter == 'aozora'):
-    formatter = formats.AozoraFormat()
-  elif(formatter == 'html'):
-    formatter = formats.HTMLFormat()
-  else:
-    formatter = formats.Format()
-  parser = mecab.PyMeCab(sentences)
+    if o in ('-b', '--buffer'):
+      try:
+        word_buffer = int(a)
+      except ValueError:
+        logger.err('invalid argument for buffer size: %s' % a)
+        sys.exit(2)
+      if word_buffer <= 0:
+        logger.err('invalid buffer size: %s' % word_buffer)
+        sys.exit(2)
+    if o in ('-a', '--approximate'):
+      try:
+        approximate = int(a)
+      except ValueError:
+        logger.err('invalid argument for approximate counting: %s' % a)
+        sys.exit(2)
+      if approximate <= 0:
+        logger.err('invalid number of words: %s' % approximate)
+        sys.exit(2)
+    if o in ('-j', '--jobs'):
+      try:
+        jobs = int(a)
+      except ValueError:
+        logger.err('invalid argument for number of jobs: %s' % a)
+        sys.exit(2)
+      if jobs <= 0:
+        logger.err('invalid number of jobs: %s' % jobs)
+        sys.exit(2)
+    if o in ('-c', '--parse-cache'):
+      cachefile = os.path.join(basedir, config.parsecache)
+    if o in ('-o', '--output'):
+      output = a
+    if o in ('-n', '--dry-run'):
+      dryrun = True
+    if o in ('-p', '--profile'):
+      profilefile = a
+    if o in ('-P', '--profile-slowest'):
+      try:
+        slowest = int(a)
+      except ValueError:
+        logger.err('invalid argument for number of files: %s' % a)
+        sys.exit(2)
+      if slowest <= 0:
+        logger.err('invalid number of files: %s' % slowest)
+        sys.exit(2)
+  if approximate and (sentences or ngrams):
+    logger.err('approximate counting cannot collect sentences or n-grams')
+    sys.exit(2)
+  if slowest and not profilefile:
+    logger.err('--profile-slowest needs --profile')
+    sys.exit(2)
+  profile = None
+  if profilefile:
+    profile = profiler.Profile(profilefile, slowest)
+  filenames = pipeline.list_files(args, recursive)
+  if dryrun:
+    # measure tokenization without storing anything
+    sink = pipeline.NullSink()
+    start = time.time()
+    pipeline.run(filenames, formatter, encoding, jobs, sink, cachefile,
+        profile)
+    seconds = time.time() - start
+    logger.out('tokenized %d words in %.2f s (%.0f words/s)'
+        % (sink.words, seconds, sink.words / max(seconds, 1e-6)))
+    if profile:
+      profile.finish()
+    return
+  if output:
+    try:
+      fp = codecs.open(output, 'w', 'utf-8')
+    except IOError as e:
+      logger.err('error opening %s: %s' % (output, e))
+      sys.exit(1)
+    with fp:
+      pipeline.run(filenames, formatter, encoding, jobs, pipeline.JSONSink(fp),
+          cachefile, profile)
+    if profile:
+      profile.finish()
+    return
   # access database
   try:
     db = database.Database(tablename)
+    db.word_buffer = word_buffer
     with db:
       if(drop):
         db.drop_table()
-      db.create_table()
+      db.create_table(False)
+      db.begin_ingest()
       # process files
       logger.out('analyzing text files')
-      if recursive:
-        for dirname in args:
-          for dirpath, dirs, files in os.walk(dirname):
-            logger.out('going through directory %s' % dirpath)
-            for filename in files:
-              analyze(os.path.join(dirpath, filename), formatter, parser, encoding, db)
+      if approximate:
+        sink = pipeline.ApproximateSink(db, approximate)
+        pipeline.run(filenames, formatter, encoding, jobs, sink, cachefile,
+            profile)
+        sink.finish()
+        counter = sink.counter
+        logger.out('counted %d words approximately, counts are at most %d '
+            'lower than exact (bound %d)' % (counter.total, counter.error,
+              counter.total // (approximate + 1)))
       else:
-        for filename in args:
-          analyze(filename, formatter, parser, encoding, db)
+        sink = pipeline.DatabaseSink(db, sentences, ngrams)
+        pipeline.run(filenames, formatter, encoding, jobs, sink, cachefile,
+            profile)
+      db.end_ingest()
       logger.out('done analyzing')
+      if profile:
+        profile.finish()
   except sqlite3.Error as e:
     logger.err('database error: %s' % e)
 
-def analyze(filename, formatter, parser, encoding, db):
-  logger.out('reading %s' % filename)
-  formatter.new_file()
-  try:
-    fp = codecs.open(filename, 'r', encoding)
-  except IOError as e:
-    logger.err('error opening %s: %s' % (filename, e))
-  else:
-    with fp:
-      # process all files line by line
-      for line in fp:
-        trimmed_line = formatter.trim(line)
-        mecab_data = parser.parse(trimmed_line, db)
-
 if __name__ == '__main__':
   main()
-
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+This is the Benchmark tool.
+It measures the speed of the Japanese Novel Analyser on synthetic texts
+in the Aozora Bunko format, which are the same in every run, and
+compares it with earlier results. If MeCab is not installed, a stub
+tagger is used, which only splits the text by kind of character.
+
+Usage: bench.py [OPTION]...
+Run the benchmarks and print the time of each
+
+Options:
+  -h, --help            Display this help
+  -o, --output=FILE     Write the results to FILE as JSON
+  -b, --baseline=FILE   Compare the results with those in FILE, written
+                        with --output before, and exit with status 1 if
+                        any benchmark got slower by more than the threshold
+  -t, --threshold=P     Threshold for slower benchmarks in percent
+                        (default 10)
+  -s, --sizes=N[,N]...  Analyse texts of N characters each, from start to
+                        end (default 100000,400000)
+  -r, --repeat=N        Run each benchmark N times and keep the fastest
+                        (default 3)
+  -n, --name=TEXT       Only run benchmarks with TEXT in their name
+  -w, --workdir=DIR     Keep texts and database in DIR instead of a
+                        temporary directory
+      --stub            Use the stub tagger even if MeCab is installed
+"""
+
+import sys
+import getopt
+import json
+import shutil
+import tempfile
+
+from logger import logger
+
+def main():
+  # parse command line options
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'ho:b:t:s:r:n:w:', ['help', 'output=', 'baseline=', 'threshold=', 'sizes=', 'repeat=', 'name=', 'workdir=', 'stub'])
+  except getopt.error as opterr:
+    logger.err(opterr)
+    logger.err('for help use --help')
+    sys.exit(2)
+  # process options
+  output = None
+  baseline = None
+  threshold = 10.0
+  sizes = [100000, 400000]
+  repeat = 3
+  pattern = u''
+  workdir = None
+  stub = False
+  for o, a in opts:
+    if o in ('-h', '--help'):
+      logger.out(__doc__)
+      sys.exit(0)
+    if o in ('-o', '--output'):
+      output = a
+    if o in ('-b', '--baseline'):
+      baseline = a
+    if o in ('-t', '--threshold'):
+      try:
+        threshold = float(a)
+      except ValueError:
+        logger.err('invalid argument for threshold: %s' % a)
+        sys.exit(2)
+    if o in ('-s', '--sizes'):
+      try:
+        sizes = [int(size) for size in a.split(',')]
+      except ValueError:
+        logger.err('invalid argument for sizes: %s' % a)
+        sys.exit(2)
+      if [size for size in sizes if size <= 0]:
+        logger.err('invalid sizes: %s' % a)
+        sys.exit(2)
+    if o in ('-r', '--repeat'):
+      try:
+        repeat = int(a)
+      except ValueError:
+        logger.err('invalid argument for repeat: %s' % a)
+        sys.exit(2)
+      if repeat <= 0:
+        logger.err('invalid number of runs: %s' % repeat)
+        sys.exit(2)
+    if o in ('-n', '--name'):
+      pattern = a.decode('utf-8')
+    if o in ('-w', '--workdir'):
+      workdir = a
+    if o == '--stub':
+      stub = True
+  base = None
+  if baseline:
+    try:
+      with open(baseline) as fp:
+        base = json.load(fp)
+    except (IOError, ValueError) as e:
+      logger.err('error reading baseline %s: %s' % (baseline, e))
+      sys.exit(1)
+  # the stub has to be in place before mecab is imported
+  tagger = 'mecab'
+  if not stub:
+    try:
+      import MeCab
+    except ImportError:
+      logger.err('MeCab is not installed, using the stub tagger')
+      stub = True
+  if stub:
+    from benchmark import stubtagger
+    sys.modules['MeCab'] = stubtagger
+    tagger = 'stub'
+  from benchmark import suite
+  temporary = workdir == None
+  if temporary:
+    workdir = tempfile.mkdtemp(prefix='bench')
+  try:
+    results = suite.Suite(workdir, sizes, repeat, pattern).run()
+  finally:
+    if temporary:
+      shutil.rmtree(workdir)
+  report = suite.report(results, tagger)
+  if output:
+    with open(output, 'w') as fp:
+      json.dump(report, fp, indent=1, sort_keys=True)
+      fp.write('\n')
+  if base:
+    for key in ('tagger', 'sqlite', 'python'):
+      if base.get(key) != report[key]:
+        logger.err('baseline was run with %s %s, not %s'
+            % (key, base.get(key), report[key]))
+    regressions = 0
+    logger.out('\n%-32s %10s %10s %8s' % ('benchmark', 'baseline', 'now', 'change'))
+    for name, before, after, change, regression in suite.compare(report, base,
+        threshold / 100):
+      logger.out('%-32s %10.4f %10.4f %+7.1f%%%s' % (name, before, after,
+        change * 100, '  SLOWER' if regression else ''))
+      regressions = regressions + regression
+    if regressions:
+      logger.err('%d benchmarks slower than %.0f%% over the baseline'
+          % (regressions, threshold))
+      sys.exit(1)
+
+if __name__ == '__main__':
+  main()
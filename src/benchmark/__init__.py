@@ -0,0 +1,5 @@
+"""
+benchmark: This package measures the speed of the analyser and the
+database on synthetic texts, so that changes in performance can be
+compared between versions, see bench.py.
+"""
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+stubtagger.py: This file stands in for the MeCab module where MeCab is
+not installed. It splits text into runs of characters of the same kind
+and tags them with fixed features, which is nowhere near a real
+analysis, but produces output of the same form at a similar rate, so
+that everything around mecab can be measured.
+"""
+
+MECAB_NOR_NODE = 0
+MECAB_UNK_NODE = 1
+MECAB_BOS_NODE = 2
+MECAB_EOS_NODE = 3
+
+# longest run of characters taken as one word
+max_word = 3
+
+def char_class(char):
+  code = ord(char)
+  if char.isspace():
+    return 'space'
+  if 0x3040 <= code < 0x30a0:
+    return 'hiragana'
+  if 0x30a0 <= code < 0x3100:
+    return 'katakana'
+  if 0x3400 <= code < 0xa000:
+    return 'kanji'
+  return 'symbol'
+
+""" Returns the features of word in the format of the IPA dictionary,
+with the root form in the seventh field. """
+def features(word):
+  kind = char_class(word[0])
+  if word in (u'。', u'！', u'？'):
+    return u'記号,句点,*,*,*,*,%s,%s,%s' % (word, word, word)
+  if kind == 'symbol':
+    return u'記号,一般,*,*,*,*,%s,%s,%s' % (word, word, word)
+  if kind == 'hiragana':
+    if len(word) > 2:
+      return u'動詞,自立,*,*,五段・ラ行,基本形,%sる,*,*' % word[:2]
+    return u'助詞,格助詞,一般,*,*,*,%s,*,*' % word
+  if kind == 'katakana':
+    return u'名詞,固有名詞,一般,*,*,*,*'
+  return u'名詞,一般,*,*,*,*,%s,*,*' % word
+
+""" Generates the words of text as pairs of their character offset and
+the word. """
+def split(text):
+  i = 0
+  while i < len(text):
+    kind = char_class(text[i])
+    if kind == 'space':
+      i = i + 1
+      continue
+    j = i + 1
+    if kind != 'symbol':
+      while j < len(text) and j - i < max_word \
+          and char_class(text[j]) == kind:
+        j = j + 1
+    yield (i, text[i:j])
+    i = j
+
+class Node():
+  def __init__(self, stat, surface, feature):
+    self.stat = stat
+    self.surface = surface
+    self.feature = feature
+    self.next = None
+
+class DictionaryInfo():
+  filename = 'stub.dic'
+  version = 0
+  size = 0
+  next = None
+
+"""
+Tagger supporting parseToNode and parse, the latter only with the node
+format of mecab.PyMeCab: byte offset, surface and features.
+"""
+class Tagger():
+  def __init__(self, arguments=''):
+    self.arguments = arguments
+
+  def dictionary_info(self):
+    return DictionaryInfo()
+
+  def parseToNode(self, text):
+    first = Node(MECAB_BOS_NODE, '', 'BOS/EOS,*,*,*,*,*,*,*,*')
+    last = first
+    for offset, word in split(text.decode('utf-8')):
+      feature = features(word)
+      stat = MECAB_NOR_NODE
+      if feature.endswith(u',*,*,*,*'):
+        stat = MECAB_UNK_NODE
+      last.next = Node(stat, word.encode('utf-8'), feature.encode('utf-8'))
+      last = last.next
+    last.next = Node(MECAB_EOS_NODE, '', 'BOS/EOS,*,*,*,*,*,*,*,*')
+    return first
+
+  def parse(self, text):
+    text = text.decode('utf-8')
+    output = []
+    # character offsets are turned into byte offsets as mecab gives them
+    offset = 0
+    position = 0
+    for start, word in split(text):
+      offset = offset + len(text[position:start].encode('utf-8'))
+      output.append(u'%d\t%s\t%s\n' % (offset, word, features(word)))
+      offset = offset + len(word.encode('utf-8'))
+      position = start + len(word)
+    output.append(u'EOS\n')
+    return u''.join(output).encode('utf-8')
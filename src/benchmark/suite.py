@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+suite.py: This file defines the benchmarks: the formatter, mecab and
+the parsing of its output, writing to and querying the database, and
+the whole analysis of texts of several sizes. Every benchmark is run
+a number of times and the fastest run is kept, which is the one least
+disturbed by other processes.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+
+import config
+import formats
+import mecab
+import pipeline
+import database
+from logger import logger
+from benchmark import synthetic
+
+# size of the text in characters used by all but the ingest benchmarks
+micro_size = 200000
+# queries of select_frequencies and the frequency pages as pairs of
+# a word and the first pos values
+frequency_queries = [(u'', []), (u'', [u'名詞']), (u'', [u'名詞', u'一般']),
+    (u'', [u'動詞', u'自立']), (u'', [u'助詞', u'格助詞', u'一般']),
+    (u'私', []), (u'先生', [u'名詞'])]
+search_queries = [u'先生', u'停車場', u'はい', u'東京 手紙', u'ている']
+
+"""
+Runs the benchmarks in a working directory, where the texts and the
+database are kept. results maps the name of each benchmark to the
+seconds of its fastest run, the amount processed in it with its unit,
+and the rate of amount per second.
+"""
+class Suite():
+  def __init__(self, workdir, sizes, repeat, pattern=u''):
+    self.workdir = workdir
+    self.sizes = sizes
+    self.repeat = repeat
+    self.pattern = pattern
+    self.results = {}
+    config.dbfile = os.path.join(workdir, 'bench.db')
+
+  """ Runs function repeat times after calling setup each time, and
+  records the time of the fastest run under name. """
+  def measure(self, name, unit, amount, function, setup=None):
+    if self.pattern not in name:
+      return
+    times = []
+    for i in range(self.repeat):
+      if setup:
+        quietly(setup)
+      times.append(quietly(function))
+    seconds = min(times)
+    self.results[name] = {'seconds': seconds, 'amount': amount,
+        'unit': unit, 'rate': amount / max(seconds, 1e-9)}
+    logger.out('%-32s %10.4f s %14.0f %s/s' % (name, seconds,
+      amount / max(seconds, 1e-9), unit))
+
+  def run(self):
+    lines = synthetic.Generator(0).text(micro_size)
+    trimmed = self.run_format(lines)
+    records = self.run_tokenize(trimmed)
+    self.run_database(records)
+    for size in self.sizes:
+      self.run_ingest(size)
+    return self.results
+
+  def run_format(self, lines):
+    formatter = formats.AozoraFormat()
+    def trim():
+      formatter.new_file()
+      for line in lines:
+        formatter.trim(line)
+    trim() # loads the gaiji table
+    self.measure('format.trim', 'lines', len(lines), trim)
+    formatter.new_file()
+    return [formatter.trim(line) for line in lines]
+
+  def run_tokenize(self, lines):
+    parse_cache = config.parse_cache
+    config.parse_cache = 0
+    try:
+      parser = mecab.PyMeCab()
+    finally:
+      config.parse_cache = parse_cache
+    records = list(parser.tokenize_lines(lines))
+    tokens = sum(len(data) for data, sentence in records)
+    def tokenize():
+      for record in parser.tokenize_lines(lines):
+        pass
+    self.measure('mecab.tokenize', 'tokens', tokens, tokenize)
+    # with a new cache each time, so that only repeats within the text hit
+    parsers = []
+    def cached():
+      for record in parsers.pop().tokenize_lines(lines):
+        pass
+    self.measure('mecab.tokenize_cached', 'tokens', tokens, cached,
+        lambda: parsers.append(mecab.PyMeCab()))
+    return records
+
+  def run_database(self, records):
+    tokens = sum(len(data) for data, sentence in records)
+    db = database.Database('bench')
+    with db:
+      def create():
+        db.drop_table()
+        db.create_table(False)
+        db.begin_ingest()
+      def insert_words():
+        for data, sentence in records:
+          for fieldvalues in data:
+            db.insert_word(fieldvalues)
+        db.flush_words()
+        db.commit()
+      self.measure('database.insert_word', 'tokens', tokens, insert_words,
+          create)
+      sink = pipeline.DatabaseSink(db, True)
+      def insert_sentences():
+        for data, sentence in records:
+          sink.write(data, sentence)
+        db.flush_words()
+        db.commit()
+      self.measure('database.insert_sentences', 'tokens', tokens,
+          insert_sentences, create)
+      if 'database.insert_sentences' not in self.results:
+        quietly(create)
+        quietly(insert_sentences)
+      quietly(db.end_ingest)
+      self.run_queries(db)
+
+  def run_queries(self, db):
+    queries = [(word, pos + [config.ALL] * (config.mecab_fields - len(pos)))
+        for word, pos in frequency_queries]
+    def frequencies():
+      for word, pos in queries:
+        db.cache.clear()
+        db.select_frequencies(word, pos)
+    self.measure('database.select_frequencies', 'queries', len(queries),
+        frequencies)
+    def pages():
+      for word, pos in queries:
+        db.cache.clear()
+        db.select_frequency_page(word, pos, config.list_number)
+    self.measure('database.select_frequency_page', 'queries', len(queries),
+        pages)
+    db.c.execute(u'SELECT wid FROM %s ORDER BY freq DESC LIMIT 20'
+        % db.freq_table)
+    wids = [row[0] for row in db.c.fetchall()]
+    def sentences():
+      for wid in wids:
+        db.cache.clear()
+        db.select_sentence_page(wid, config.list_number)
+    self.measure('database.select_sentences', 'queries', len(wids),
+        sentences)
+    if db.table_exists(db.search_table):
+      def search():
+        for text in search_queries:
+          db.cache.clear()
+          db.select_search_page(text, config.list_number)
+      self.measure('database.select_search', 'queries', len(search_queries),
+          search)
+
+  def run_ingest(self, size):
+    filename = os.path.join(self.workdir, 'corpus-%d.txt' % size)
+    if not os.path.exists(filename):
+      synthetic.Generator(size).write(filename, size)
+    db = database.Database('bench')
+    with db:
+      def create():
+        db.drop_table()
+        db.create_table(False)
+        db.begin_ingest()
+      def ingest():
+        pipeline.run([filename], 'aozora', 'auto', 1,
+            pipeline.DatabaseSink(db, True))
+        db.end_ingest()
+      self.measure('ingest.%d' % size, 'bytes', os.path.getsize(filename),
+          ingest, create)
+
+""" Calls function without the messages of the analyser and returns
+the seconds it took. """
+def quietly(function):
+  verbosity = logger.verbosity
+  logger.verbosity = -1
+  try:
+    start = time.time()
+    function()
+    return time.time() - start
+  finally:
+    logger.verbosity = verbosity
+
+""" Returns the results of the benchmarks with information about the
+environment they were run in, which should be equal for comparisons. """
+def report(results, tagger):
+  return {'version': 1, 'tagger': tagger, 'sqlite': sqlite3.sqlite_version,
+      'python': '%d.%d.%d' % sys.version_info[:3], 'results': results}
+
+"""
+Compares the results in report with those in baseline. Returns a list
+of (name, baseline seconds, seconds, relative change, regression),
+where regression tells if the benchmark got slower by more than
+threshold, a fraction of the baseline time.
+"""
+def compare(report, baseline, threshold):
+  comparison = []
+  for name in sorted(report['results']):
+    if name not in baseline['results']:
+      continue
+    before = baseline['results'][name]['seconds']
+    after = report['results'][name]['seconds']
+    change = after / max(before, 1e-9) - 1
+    comparison.append((name, before, after, change, change > threshold))
+  return comparison
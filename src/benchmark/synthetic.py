@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+synthetic.py: This file generates texts in the Aozora Bunko format for
+benchmarks. The texts are made up of random words, but have the parts
+which make up the work of the formatter: a header with the explanation
+of symbols, furigana, gaiji and other annotations, headings, repeated
+lines of dialogue and a postscript. The same seed always gives the
+same text.
+"""
+
+import bisect
+import random
+
+# words with a rough share of kanji, kana and katakana; earlier words
+# are chosen more often
+nouns = [u'私', u'彼', u'事', u'時', u'人', u'家', u'日', u'手', u'顔', u'声',
+    u'先生', u'自分', u'今日', u'東京', u'学校', u'世間', u'心持', u'部屋',
+    u'電車', u'手紙', u'着物', u'座敷', u'障子', u'書物', u'停車場',
+    u'ランプ', u'ステッキ', u'ハンケチ', u'インキ', u'テーブル']
+verbs = [u'する', u'なる', u'ある', u'いる', u'見る', u'言う', u'思う',
+    u'来る', u'行く', u'聞く', u'考える', u'帰る', u'歩く', u'笑う']
+endings = [u'た', u'て', u'ない', u'ます', u'ました', u'ません', u'う',
+    u'ている', u'ていた']
+particles = [u'は', u'が', u'を', u'に', u'の', u'で', u'と', u'へ', u'も',
+    u'から', u'まで']
+# short lines of dialogue, which are repeated throughout a text
+dialogue = [u'「はい」', u'「ええ」', u'「そうですか」', u'「いいえ」',
+    u'「なぜ」', u'「さあ」', u'「まあ」', u'「どうして」']
+# readings given as furigana to some nouns
+readings = {u'心持': u'こころもち', u'座敷': u'ざしき', u'障子': u'しょうじ',
+    u'停車場': u'ていしゃば', u'着物': u'きもの', u'世間': u'せけん'}
+# gaiji annotations of codes in the table of data/, with their kanji
+gaiji = [u'※［＃「魚＋生」、第3水準1-94-39］', u'※［＃「口＋虚」、第3水準1-84-7］',
+    u'※［＃「一／丁」、第4水準2-1-2］', u'※［＃「土＋口」、第3水準1-14-2］',
+    u'※［＃ローマ数字1、1-13-21］']
+headings = [u'一', u'二', u'三', u'四', u'五', u'六', u'七', u'八', u'九', u'十']
+
+"""
+Generates texts of about size characters. Each text is a list of lines
+without line ends, made up of a header, the body and a postscript.
+"""
+class Generator():
+  def __init__(self, seed=0):
+    self.random = random.Random(seed)
+    # cumulative weights by number of words
+    self.weights = {}
+
+  """ Chooses a word from words, earlier ones more often, like in
+  Zipf's law. """
+  def choose(self, words):
+    weights = self.weights.get(len(words))
+    if weights == None:
+      weights = self.weights[len(words)] = self.cumulative(len(words))
+    value = self.random.random() * weights[-1]
+    return words[bisect.bisect_right(weights, value)]
+
+  def cumulative(self, n):
+    total = 0.0
+    weights = []
+    for rank in range(1, n + 1):
+      total = total + 1.0 / rank
+      weights.append(total)
+    return weights
+
+  def noun(self):
+    noun = self.choose(nouns)
+    roll = self.random.random()
+    if noun in readings and roll < 0.3:
+      # furigana, sometimes with the marker of where the reading starts
+      if roll < 0.1:
+        return u'｜%s《%s》' % (noun, readings[noun])
+      return u'%s《%s》' % (noun, readings[noun])
+    if roll > 0.99:
+      return self.random.choice(gaiji)
+    return noun
+
+  def sentence(self):
+    words = []
+    for i in range(self.random.randint(1, 4)):
+      words.append(self.noun())
+      words.append(self.choose(particles))
+    verb = self.choose(verbs)
+    words.append(verb[:-1] + self.choose(endings))
+    if self.random.random() < 0.05:
+      words.append(u'［＃「%s」に傍点］' % verb[:-1])
+    return u''.join(words) + u'。'
+
+  def paragraph(self):
+    if self.random.random() < 0.25:
+      return self.choose(dialogue)
+    sentences = [self.sentence()
+        for i in range(self.random.randint(1, 6))]
+    return u'　' + u''.join(sentences)
+
+  def header(self, title):
+    return [title, u'著者', u'',
+        u'-------------------------------------------------------',
+        u'【テキスト中に現れる記号について】', u'',
+        u'《》：ルビ', u'（例）心持《こころもち》', u'',
+        u'｜：ルビの付く文字列の始まりを特定する記号',
+        u'（例）停車場｜東京《とうきょう》', u'',
+        u'［＃］：入力者注　主に外字の説明や、傍点の位置の指定',
+        u'　　　（数字は、JIS X 0213の面区点番号、または底本のページと行数）',
+        u'（例）※［＃「魚＋生」、第3水準1-94-39］',
+        u'-------------------------------------------------------', u'']
+
+  def postscript(self):
+    return [u'', u'', u'', u'底本：「著作集　第一巻」出版社',
+        u'　　　1900（明治33）年1月1日発行',
+        u'入力：入力者', u'校正：校正者', u'2000年1月1日作成',
+        u'青空文庫作成ファイル：',
+        u'このファイルは、インターネットの図書館、青空文庫で作られました。']
+
+  """ Returns the lines of a text of about size characters. """
+  def text(self, size, title=u'題名'):
+    lines = self.header(title)
+    length = 0
+    chapter = 0
+    while length < size:
+      if length >= chapter * 20000 and chapter < len(headings):
+        heading = headings[chapter]
+        lines.append(u'［＃５字下げ］%s［＃「%s」は中見出し］' % (heading, heading))
+        chapter = chapter + 1
+      line = self.paragraph()
+      lines.append(line)
+      length = length + len(line)
+    return lines + self.postscript()
+
+  """ Writes a text of about size characters to filename in encoding,
+  which is Shift_JIS like on Aozora Bunko by default. """
+  def write(self, filename, size, encoding='cp932'):
+    with open(filename, 'wb') as fp:
+      for line in self.text(size):
+        fp.write((line + u'\r\n').encode(encoding))
@@ -0,0 +1,34 @@
+"""
+cache.py: This file defines a bounded cache for query results, which
+evicts the least recently used entries first.
+"""
+
+from collections import OrderedDict
+
+class LRUCache():
+  def __init__(self, size):
+    self.size = size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  """ Returns the value stored for key, or None if there is none. """
+  def get(self, key):
+    try:
+      value = self.entries.pop(key)
+    except KeyError:
+      self.misses = self.misses + 1
+      return None
+    # reinsert as most recently used
+    self.entries[key] = value
+    self.hits = self.hits + 1
+    return value
+
+  def put(self, key, value):
+    self.entries.pop(key, None)
+    self.entries[key] = value
+    if len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+
+  def clear(self):
+    self.entries.clear()
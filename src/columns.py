@@ -0,0 +1,152 @@
+"""
+columns.py: This file loads a frequency table into NumPy arrays for
+computing statistics over all words at once. The word and pos columns
+are dictionary encoded, and the arrays are cached as .npy files, from
+which they are memory-mapped as long as the table is unchanged.
+"""
+
+import os
+import os.path
+import json
+
+import numpy
+
+import config
+
+"""
+The columns of a frequency table: freq holds the frequencies, word and
+pos0, pos1, ... the codes of the values, which are looked up in the
+lists of the same name in values.
+"""
+class FrequencyColumns():
+  def __init__(self, db, refresh=False):
+    self.names = db.fieldnames
+    self.directory = os.path.join(config.get_basedir(), config.columns_dir,
+        db.freq_table)
+    stamp = db.select_stamp()
+    if stamp != None:
+      stamp = list(stamp)
+    # without a stamp, the table cannot be told unchanged
+    if refresh or stamp == None or self.read_stamp() != stamp:
+      self.export(db)
+      self.write_stamp(stamp)
+    self.load()
+
+  def read_stamp(self):
+    try:
+      with open(os.path.join(self.directory, 'stamp.json')) as fp:
+        return json.load(fp)
+    except (IOError, ValueError):
+      return None
+
+  def write_stamp(self, stamp):
+    with open(os.path.join(self.directory, 'stamp.json'), 'w') as fp:
+      json.dump(stamp, fp)
+
+  """ Writes the columns of the table to the cache. """
+  def export(self, db):
+    if not os.path.isdir(self.directory):
+      os.makedirs(self.directory)
+    (rows, cursor) = db.select_all_words()
+    freq = numpy.zeros(rows, numpy.int64)
+    codes = [numpy.zeros(rows, numpy.int32) for name in self.names]
+    dictionaries = [{} for name in self.names]
+    for i, row in enumerate(cursor):
+      freq[i] = row[0]
+      for column, values, value in zip(codes, dictionaries, row[1:]):
+        code = values.get(value)
+        if code == None:
+          code = values[value] = len(values)
+        column[i] = code
+    numpy.save(self.path('freq'), freq)
+    for name, column, values in zip(self.names, codes, dictionaries):
+      numpy.save(self.path(name), column)
+      ordered = sorted(values, key=values.get)
+      numpy.save(self.path(name + '_values'), numpy.array(ordered, numpy.unicode_))
+
+  def load(self):
+    self.freq = numpy.load(self.path('freq'), mmap_mode='r')
+    self.codes = {}
+    self.values = {}
+    for name in self.names:
+      self.codes[name] = numpy.load(self.path(name), mmap_mode='r')
+      self.values[name] = numpy.load(self.path(name + '_values')).tolist()
+
+  def path(self, name):
+    return os.path.join(self.directory, name + '.npy')
+
+  """ Returns a boolean mask selecting the rows with the given pos
+  values, where values equal to config.ALL select everything. """
+  def select(self, pos):
+    mask = numpy.ones(len(self.freq), bool)
+    for name, value in zip(self.names[1:], pos):
+      if value != config.ALL:
+        try:
+          code = self.values[name].index(value)
+        except ValueError:
+          return numpy.zeros(len(self.freq), bool)
+        mask &= self.codes[name] == code
+    return mask
+
+"""
+Statistics of the rows of columns selected by mask, or of all rows.
+The rows are ordered by frequency, so ranks are positions.
+"""
+class FrequencyStats():
+  def __init__(self, columns, mask=None):
+    self.columns = columns
+    if mask is None:
+      self.freq = numpy.asarray(columns.freq)
+      self.codes = columns.codes
+    else:
+      self.freq = numpy.asarray(columns.freq)[mask]
+      self.codes = dict((name, numpy.asarray(column)[mask])
+          for name, column in columns.codes.iteritems())
+    self.tokens = int(self.freq.sum())
+
+  def relative(self):
+    return self.freq / float(max(self.tokens, 1))
+
+  """ Returns for each rank the fraction of the text covered by the
+  words up to that rank. """
+  def coverage(self):
+    return numpy.cumsum(self.freq) / float(max(self.tokens, 1))
+
+  """ Returns the number of most frequent words needed to cover the
+  given fraction of the text. """
+  def words_for_coverage(self, fraction):
+    return int(numpy.searchsorted(self.coverage(), fraction) + 1)
+
+  """ Returns the type/token figures (entries, distinct words, tokens,
+  hapax legomena), where entries distinguish words by their pos. """
+  def types(self):
+    words = numpy.count_nonzero(numpy.bincount(self.codes[u'word']))
+    hapax = int(numpy.count_nonzero(self.freq == 1))
+    return (len(self.freq), words, self.tokens, hapax)
+
+  """
+  Fits Zipf's law freq = c / rank^s by least squares on the log-log
+  scale and returns (s, c, r2), with r2 the coefficient of determination.
+  """
+  def zipf(self):
+    if len(self.freq) < 2:
+      return (0.0, float(self.tokens), 0.0)
+    x = numpy.log(numpy.arange(1, len(self.freq) + 1))
+    y = numpy.log(self.freq)
+    slope, intercept = numpy.polyfit(x, y, 1)
+    residual = y - (slope * x + intercept)
+    variance = ((y - y.mean()) ** 2).sum()
+    r2 = 1 - (residual ** 2).sum() / variance if variance > 0 else 1.0
+    return (-slope, numpy.exp(intercept), r2)
+
+  """ Returns the breakdown by the pos column name as rows (value,
+  entries, tokens), ordered by tokens. """
+  def breakdown(self, name):
+    codes = self.codes[name]
+    size = len(self.columns.values[name])
+    tokens = numpy.bincount(codes, weights=self.freq, minlength=size)
+    entries = numpy.bincount(codes, minlength=size)
+    order = numpy.argsort(-tokens, kind='mergesort')
+    values = self.columns.values[name]
+    return [(values[i], int(entries[i]), int(tokens[i]))
+        for i in order if entries[i] > 0]
@@ -11,17 +11,41 @@ ALL = u'*'
 # default format for input files
 formatter = 'plain'
 # encoding of input files
-encoding  = 'utf-8'
+encoding  = 'auto'
 # database file
 dbfile    = 'data/freqs.db'
+columns_dir = 'data/columns'
 # default tablename
 tablename = 'main'
 # file containing unicode equivalents for gaiji codes
 gaijifile ='data/jisx0213-2004-8bit-std.txt'
+gaijicache = 'data/jisx0213-2004-8bit-std.marshal'
 # number of mecab pos fields to use
 mecab_fields = 5
+# number of characters passed to mecab at once (about 64KB in UTF-8),
+# or 0 to pass every line on its own
+mecab_block = 20000
+# number of parsed lines kept in memory to skip tokenizing repeated
+# lines, or 0 to tokenize every line
+parse_cache = 10000
+# file keeping all parsed lines with --parse-cache
+parsecache = 'data/parses.db'
 # number of items to load to word list
 list_number = 100
+# number of query results kept by the frequency browser
+result_cache = 500
+# number of distinct words counted in memory before they are
+# written to the database (roughly 200 bytes per word)
+word_buffer = 100000
+ngram_buffer = 500000
+# commit while analysing after this many sentences or seconds
+commit_sentences = 100000
+commit_seconds = 60
+# seconds between reports of the throughput so far with --profile
+profile_interval = 60
+# database page cache and memory mapping sizes in KiB and bytes
+cache_size = 262144
+mmap_size = 268435456
 
 # get path of main program directory
 def get_basedir():
@@ -5,10 +5,15 @@ and performing queries on the data.
 
 import sqlite3
 import os
+import time
+import hashlib
+import struct
+import math
 
 import config
 from config import ALL
 from logger import logger
+from cache import LRUCache
 
 class Database():
 
@@ -21,21 +26,57 @@ class Database():
     self.freq_table = tablename + '_freqs'
     self.sentence_table = tablename + '_sentences'
     self.link_table = tablename + '_links'
+    self.file_table = tablename + '_files'
+    self.docfreq_table = tablename + '_docfreqs'
+    self.docsentence_table = tablename + '_docsentences'
+    self.postree_table = tablename + '_postree'
+    self.wordtotal_table = tablename + '_wordtotals'
+    self.stamp_table = tablename + '_stamp'
+    self.ngram_table = tablename + '_ngrams'
+    self.docngram_table = tablename + '_docngrams'
+    self.search_table = tablename + '_search'
+    self.gram_table = tablename + '_searchgrams'
     # data fields are the word and the parts of speech
     self.fields = config.mecab_fields + 1
     self.fieldnames = [u'word']
     for i in range(config.mecab_fields):
       self.fieldnames.append(u'pos' + str(i))
+    # word counts accumulated in memory until flushed
+    self.counts = {}
+    self.word_buffer = config.word_buffer
+    # frequency increments of known words by word id, see insert_word
+    self.increments = {}
+    # n-gram counts accumulated in memory until flushed
+    self.ngram_counts = {}
+    self.ngram_buffer = config.ngram_buffer
+    # rows written and sentences inserted since the last commit
+    self.rows = 0
+    self.sentences = 0
+    self.commit_time = time.time()
+    # document being analysed, with its word counts by word id
+    self.did = None
+    self.doc_counts = {}
+    self.doc_sentences = set()
+    self.last_sid = None
+    # query results, valid as long as the database is unchanged
+    self.cache = LRUCache(config.result_cache)
+    self.cache_version = None
 
   def __enter__(self):
     logger.out('connecting to database')
     self.conn = sqlite3.connect(self.filename)
+    # rows written until the stamp was last counted, see bump_stamp
+    self.stamp_changes = self.conn.total_changes
     self.c = self.conn.cursor() # Cursor for word frequency queries
     self.c2 = self.conn.cursor() # Cursor for sentence queries
     self.c3 = self.conn.cursor() # Cursor for option selections
+    # used by the triggers of the full-text index
+    self.conn.create_function('search_grams', 1, search_grams)
     self.prepare_queries()
 
-  def create_table(self):
+  """ Creates the tables, and their indexes unless indexes is False,
+  in which case create_indexes has to be called later. """
+  def create_table(self, indexes=True):
     # create freq table
     sql = u'CREATE TABLE IF NOT EXISTS %s ( \
         wid INTEGER PRIMARY KEY, freq INTEGER' % self.freq_table
@@ -47,60 +88,661 @@ class Database():
     sql = sql.rstrip(u', ')
     sql = sql + u'))'
     self.c.execute(sql)
-    # create sentence table
+    # create sentence table, identifying sentences by their hash
     sql = u'CREATE TABLE IF NOT EXISTS %s ( \
-        sid INTEGER PRIMARY KEY, sentence TEXT, len INTEGER)' % self.sentence_table
+        sid INTEGER PRIMARY KEY, sentence TEXT, len INTEGER, hash INTEGER)'\
+        % self.sentence_table
     self.c.execute(sql)
-    # create link table
+    # create link table, storing each pair only once; the sentence length
+    # is part of the key so that sentences of a word are ordered by length
     sql = u'CREATE TABLE IF NOT EXISTS %s ( \
-        wid INTEGER, sid INTEGER, \
+        wid INTEGER, len INTEGER, sid INTEGER, \
+        PRIMARY KEY (wid, len, sid), \
         FOREIGN KEY(wid) REFERENCES %s(wid), \
-        FOREIGN KEY(sid) REFERENCES %s(sid))'\
+        FOREIGN KEY(sid) REFERENCES %s(sid)) WITHOUT ROWID'\
         % (self.link_table, self.freq_table, self.sentence_table)
     self.c.execute(sql)
-    # create indices for faster lookup
-    sql = 'CREATE INDEX IF NOT EXISTS freq_index ON %s (freq DESC)' % self.freq_table
+    for table, column in ((self.sentence_table, u'hash'), (self.link_table, u'len')):
+      self.c.execute(u'PRAGMA table_info(%s)' % table)
+      if column not in [row[1] for row in self.c.fetchall()]:
+        raise sqlite3.DatabaseError('table %s was created by an older version, '
+            'use --droptable to recreate it' % table)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_hash_index ON %s (hash)'\
+        % (self.sentence_table, self.sentence_table)
     self.c.execute(sql)
-    sql = 'CREATE INDEX IF NOT EXISTS len_index ON %s (len ASC)' % self.sentence_table
+    # create manifest of analysed files and their word counts
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        did INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, \
+        mtime REAL, hash TEXT, committed INTEGER, \
+        first_sid INTEGER, last_sid INTEGER)' % self.file_table
+    self.c.execute(sql)
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        did INTEGER, wid INTEGER, freq INTEGER, \
+        PRIMARY KEY (did, wid), \
+        FOREIGN KEY(did) REFERENCES %s(did), \
+        FOREIGN KEY(wid) REFERENCES %s(wid)) WITHOUT ROWID'\
+        % (self.docfreq_table, self.file_table, self.freq_table)
+    self.c.execute(sql)
+    self.create_docsentences()
+    # create n-gram tables of roots, in which bigrams have an empty w3
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        w1 TEXT, w2 TEXT, w3 TEXT, freq INTEGER, \
+        PRIMARY KEY (w1, w2, w3)) WITHOUT ROWID' % self.ngram_table
     self.c.execute(sql)
-    jql = 'CREATE INDEX IF NOT EXISTS link_wid_index ON %s (wid ASC)' % self.link_table
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        did INTEGER, w1 TEXT, w2 TEXT, w3 TEXT, freq INTEGER, \
+        PRIMARY KEY (did, w1, w2, w3), \
+        FOREIGN KEY(did) REFERENCES %s(did)) WITHOUT ROWID'\
+        % (self.docngram_table, self.file_table)
     self.c.execute(sql)
+    self.create_postree()
+    self.create_wordtotals()
+    self.create_stamp()
+    if indexes:
+      self.create_indexes()
     self.conn.commit()
     logger.out('created database tables')
 
+  """
+  Creates the table of the sentences of each document. A sentence is
+  stored only once, even if several documents contain it, so it may only
+  be removed with the last of them. When the table is added to an
+  existing table, it is filled from the range of sentence ids which
+  each document inserted.
+  """
+  def create_docsentences(self):
+    self.c.execute(u'SELECT count(*) FROM sqlite_master WHERE name = ?',
+        (self.docsentence_table,))
+    exists = self.c.fetchone()[0] > 0
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        did INTEGER, sid INTEGER, \
+        PRIMARY KEY (did, sid), \
+        FOREIGN KEY(did) REFERENCES %s(did), \
+        FOREIGN KEY(sid) REFERENCES %s(sid)) WITHOUT ROWID'\
+        % (self.docsentence_table, self.file_table, self.sentence_table)
+    self.c.execute(sql)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_sid_index ON %s (sid)'\
+        % (self.docsentence_table, self.docsentence_table)
+    self.c.execute(sql)
+    if not exists:
+      self.c.execute(u'INSERT INTO %s SELECT f.did, s.sid FROM %s f, %s s \
+          WHERE s.sid BETWEEN f.first_sid AND f.last_sid'
+          % (self.docsentence_table, self.file_table, self.sentence_table))
+
+  """
+  Creates the pos tree, which holds the frequency sum and number of words
+  of every node of the pos hierarchy. A node of depth d has the values
+  of pos0 to pos(d-1), the others are empty, and the root has depth 0.
+  Triggers keep it up to date whenever the freq table changes, so it is
+  rebuilt only when it is added to an existing table.
+  """
+  def create_postree(self):
+    self.c.execute(u'SELECT count(*) FROM sqlite_master WHERE name = ?',
+        (self.postree_table,))
+    exists = self.c.fetchone()[0] > 0
+    posnames = self.fieldnames[1:]
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        depth INTEGER, %s TEXT, freq INTEGER, words INTEGER, \
+        PRIMARY KEY (depth, %s)) WITHOUT ROWID' \
+        % (self.postree_table, u' TEXT, '.join(posnames), u', '.join(posnames))
+    self.c.execute(sql)
+    # one statement per ancestor of the word, each finding its node by key
+    insert = []
+    update = []
+    delete = []
+    for depth in range(self.fields):
+      values = [u'new.' + name for name in posnames[:depth]] + \
+          [u"''"] * (len(posnames) - depth)
+      key = u'depth = %d AND ' % depth + u' AND '.join(
+          [u'%s = %s' % (name, value) for name, value in zip(posnames, values)])
+      insert.append(u'INSERT INTO %s VALUES (%d, %s, new.freq, 1) \
+          ON CONFLICT DO UPDATE SET freq = freq + excluded.freq, words = words + 1;'
+          % (self.postree_table, depth, u', '.join(values)))
+      update.append(u'UPDATE %s SET freq = freq + new.freq - old.freq WHERE %s;'
+          % (self.postree_table, key))
+      key = key.replace(u'new.', u'old.')
+      delete.append(u'UPDATE %s SET freq = freq - old.freq, words = words - 1 \
+          WHERE %s;' % (self.postree_table, key))
+      delete.append(u'DELETE FROM %s WHERE words = 0 AND %s;'
+          % (self.postree_table, key))
+    for name, event, body in ((u'insert', u'INSERT', insert),
+        (u'update', u'UPDATE OF freq', update), (u'delete', u'DELETE', delete)):
+      self.c.execute(u'CREATE TRIGGER IF NOT EXISTS %s_%s AFTER %s ON %s \
+          BEGIN %s END' % (self.postree_table, name, event, self.freq_table,
+            u'\n'.join(body)))
+    if not exists:
+      self.rebuild_postree()
+
+  def rebuild_postree(self):
+    self.c.execute(u'DELETE FROM %s' % self.postree_table)
+    posnames = self.fieldnames[1:]
+    for depth in range(self.fields):
+      group = posnames[:depth]
+      columns = group + [u"''"] * (len(posnames) - depth)
+      sql = u'INSERT INTO %s SELECT %d, %s, sum(freq), count(*) FROM %s' \
+          % (self.postree_table, depth, u', '.join(columns), self.freq_table)
+      if group:
+        sql = sql + u' GROUP BY ' + u', '.join(group)
+      else:
+        sql = sql + u' HAVING count(*) > 0'
+      self.c.execute(sql)
+
+  """
+  Creates the table of word totals, which holds the frequency sum and
+  number of pos variants of every word. Like the pos tree it is kept up
+  to date by triggers, and built when it is added to an existing table.
+  """
+  def create_wordtotals(self):
+    self.c.execute(u'SELECT count(*) FROM sqlite_master WHERE name = ?',
+        (self.wordtotal_table,))
+    exists = self.c.fetchone()[0] > 0
+    sql = u'CREATE TABLE IF NOT EXISTS %s ( \
+        word TEXT PRIMARY KEY, freq INTEGER, variants INTEGER) WITHOUT ROWID' \
+        % self.wordtotal_table
+    self.c.execute(sql)
+    table = self.wordtotal_table
+    insert = u'INSERT INTO %s VALUES (new.word, new.freq, 1) \
+        ON CONFLICT DO UPDATE SET freq = freq + excluded.freq, \
+        variants = variants + 1;' % table
+    update = u'UPDATE %s SET freq = freq + new.freq - old.freq \
+        WHERE word = new.word;' % table
+    delete = u'UPDATE %s SET freq = freq - old.freq, variants = variants - 1 \
+        WHERE word = old.word; DELETE FROM %s WHERE variants = 0 \
+        AND word = old.word;' % (table, table)
+    for name, event, body in ((u'insert', u'INSERT', insert),
+        (u'update', u'UPDATE OF freq', update), (u'delete', u'DELETE', delete)):
+      self.c.execute(u'CREATE TRIGGER IF NOT EXISTS %s_%s AFTER %s ON %s \
+          BEGIN %s END' % (table, name, event, self.freq_table, body))
+    if not exists:
+      self.rebuild_wordtotals()
+
+  """
+  Creates the stamp of the tables, which is the time they were created
+  and the number of commits which changed them, counted by bump_stamp.
+  Copies of the freq table made with the same stamp are still up to
+  date, see columns.py.
+  """
+  def create_stamp(self):
+    table = self.stamp_table
+    self.c.execute(u'CREATE TABLE IF NOT EXISTS %s ( \
+        created REAL, changes INTEGER)' % table)
+    self.c.execute(u'INSERT INTO %s SELECT ?, 0 \
+        WHERE NOT EXISTS (SELECT 1 FROM %s)' % (table, table), (time.time(),))
+
+  """ Counts a change in the stamp if any rows were written since the
+  last count, which is called before committing. Counting per row with
+  triggers would slow down every update of the frequencies. """
+  def bump_stamp(self):
+    if self.conn.total_changes != self.stamp_changes:
+      self.c.execute(u'UPDATE %s SET changes = changes + 1' % self.stamp_table)
+      self.stamp_changes = self.conn.total_changes
+
+  def rebuild_wordtotals(self):
+    self.c.execute(u'DELETE FROM %s' % self.wordtotal_table)
+    self.c.execute(u'INSERT INTO %s SELECT word, sum(freq), count(*) \
+        FROM %s GROUP BY word' % (self.wordtotal_table, self.freq_table))
+
+  """
+  Creates the indexes for the queries of the frequency browser. Words
+  are ranked by frequency and id for any prefix of pos values, so pages
+  can be read starting after the last word of the previous page. Options are
+  selected from the complete pos hierarchy. Sentences of a word need no
+  index, as the link table is ordered by word, sentence length and id.
+  """
+  def create_indexes(self):
+    # indexes of older versions, replaced by the rank indexes
+    self.c.execute(u'DROP INDEX IF EXISTS %s_freq_index' % self.freq_table)
+    for i in range(1, self.fields - 1):
+      self.c.execute(u'DROP INDEX IF EXISTS %s_pos%d_index'
+          % (self.freq_table, i - 1))
+    sql = u'CREATE INDEX IF NOT EXISTS %s_rank_index ON %s (freq DESC, wid DESC)'\
+        % (self.freq_table, self.freq_table)
+    self.c.execute(sql)
+    for i in range(1, self.fields - 1):
+      sql = u'CREATE INDEX IF NOT EXISTS %s_pos%d_rank_index ON %s (%s, freq DESC, wid DESC)'\
+          % (self.freq_table, i - 1, self.freq_table,
+            u', '.join(self.fieldnames[1:i + 1]))
+      self.c.execute(sql)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_pos_index ON %s (%s)'\
+        % (self.freq_table, self.freq_table, u', '.join(self.fieldnames[1:]))
+    self.c.execute(sql)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_len_index ON %s (len ASC)'\
+        % (self.sentence_table, self.sentence_table)
+    self.c.execute(sql)
+    # groups are ranked by their totals like words
+    sql = u'CREATE INDEX IF NOT EXISTS %s_rank_index ON %s (freq DESC, word DESC)'\
+        % (self.wordtotal_table, self.wordtotal_table)
+    self.c.execute(sql)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_rank_index ON %s (depth, freq DESC, %s)'\
+        % (self.postree_table, self.postree_table,
+          u' DESC, '.join(self.fieldnames[1:]) + u' DESC')
+    self.c.execute(sql)
+    # n-grams are looked up by each of their words
+    sql = u'CREATE INDEX IF NOT EXISTS %s_w2_index ON %s (w2, w3)'\
+        % (self.ngram_table, self.ngram_table)
+    self.c.execute(sql)
+    sql = u'CREATE INDEX IF NOT EXISTS %s_w3_index ON %s (w3, w1)'\
+        % (self.ngram_table, self.ngram_table)
+    self.c.execute(sql)
+    self.conn.commit()
+
+  """
+  Creates the full-text indexes of the sentences, two FTS5 tables kept up
+  to date by triggers, so they are only built when they are added to an
+  existing table. The first uses the trigram tokenizer, which finds any
+  substring of three or more characters, and refers to the sentence
+  table instead of storing the sentences again. The second holds the
+  characters and character pairs of every sentence, see search_grams,
+  for shorter substrings. It stores nothing else, so the pairs of a
+  removed sentence are made again to delete them. Returns whether the
+  indexes are available, which requires SQLite 3.34 or later.
+  """
+  def create_search_index(self):
+    if self.table_exists(self.search_table) \
+        and self.table_exists(self.gram_table):
+      return True
+    # indexes of older versions lack the second table
+    self.drop_search_index()
+    try:
+      self.c.execute(u"CREATE VIRTUAL TABLE %s USING fts5(sentence, \
+          content='%s', content_rowid='sid', tokenize='trigram')"
+          % (self.search_table, self.sentence_table))
+      # every character but white space is part of a token
+      self.c.execute(u'CREATE VIRTUAL TABLE %s USING fts5(grams, \
+          content=\'\', detail=none, columnsize=0, tokenize="unicode61 \
+            remove_diacritics 0 categories \'L* M* N* P* S* C*\'")'
+          % self.gram_table)
+    except sqlite3.OperationalError as e:
+      logger.err('full-text search is not available: %s' % e)
+      self.drop_search_index()
+      return False
+    logger.out('creating full-text index')
+    self.c.execute(u"INSERT INTO %s (%s) VALUES ('rebuild')"
+        % (self.search_table, self.search_table))
+    self.c.execute(u'INSERT INTO %s (rowid, grams) \
+        SELECT sid, search_grams(sentence) FROM %s'
+        % (self.gram_table, self.sentence_table))
+    self.c.execute(u'CREATE TRIGGER %s_insert AFTER INSERT ON %s BEGIN \
+        INSERT INTO %s (rowid, sentence) VALUES (new.sid, new.sentence); \
+        INSERT INTO %s (rowid, grams) \
+        VALUES (new.sid, search_grams(new.sentence)); END'
+        % (self.search_table, self.sentence_table, self.search_table,
+          self.gram_table))
+    self.c.execute(u"CREATE TRIGGER %s_delete AFTER DELETE ON %s BEGIN \
+        INSERT INTO %s (%s, rowid, sentence) \
+        VALUES ('delete', old.sid, old.sentence); \
+        INSERT INTO %s (%s, rowid, grams) \
+        VALUES ('delete', old.sid, search_grams(old.sentence)); END"
+        % (self.search_table, self.sentence_table, self.search_table,
+          self.search_table, self.gram_table, self.gram_table))
+    self.conn.commit()
+    return True
+
+  def drop_search_index(self):
+    self.c.execute(u'DROP TRIGGER IF EXISTS %s_insert' % self.search_table)
+    self.c.execute(u'DROP TRIGGER IF EXISTS %s_delete' % self.search_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.search_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.gram_table)
+
+  def table_exists(self, name):
+    self.c3.execute(u'SELECT count(*) FROM sqlite_master WHERE name = ?',
+        (name,))
+    return self.c3.fetchone()[0] > 0
+
+  """
+  Checks the query plans of all query shapes used by the frequency
+  browser and returns those which scan a whole table although they
+  filter it, or which sort their results, as pairs of query and plan.
+  Sorting is accepted when selecting a single word, which has only a
+  handful of rows.
+  """
+  def check_query_plans(self):
+    queries = []
+    for word in (u'', u'x'):
+      for n in range(self.fields):
+        pos = [u'x'] * n + [ALL] * (self.fields - 1 - n)
+        queries.append((self.frequency_query(word, pos, True)[1], word == u''))
+        if n < self.fields - 1:
+          queries.append((self.options_query(word, pos, n)[0], word == u''))
+          queries.append((self.postree_query(pos, n, True)[0], True))
+        queries.append((self.postree_query(pos, n)[0], True))
+    queries.append((self.sentence_query(True), True))
+    queries.append((self.collocate_query(), False))
+    queries.append((self.word_sentence_query(3, True), True))
+    for n in range(self.fields):
+      group = self.fieldnames[:1] if n == 0 else self.fieldnames[1:n + 1]
+      for word in (u'', u'x'):
+        queries.append((self.group_query(group, word, [ALL] * (self.fields - 1),
+          True)[0], word == u''))
+    problems = []
+    tables = (self.freq_table, self.sentence_table, self.link_table,
+        self.postree_table, self.wordtotal_table, self.ngram_table)
+    for sql, unsorted in queries:
+      vals = [u'x'] * sql.count(u'?')
+      self.c.execute(u'EXPLAIN QUERY PLAN ' + sql, vals)
+      plan = [row[-1] for row in self.c.fetchall()]
+      for step in plan:
+        # scans of subquery results are not checked
+        if unsorted and u'TEMP B-TREE' in step or u'WHERE' in sql and \
+            step.startswith(u'SCAN') and step.split()[1] in tables \
+            and u'INDEX' not in step:
+          problems.append((sql, plan))
+          break
+    return problems
+
   def prepare_queries(self):
     # prepare queries for later select, update and insert queries
     self.sql_sel = u'SELECT wid FROM %s WHERE ' % self.freq_table
-    self.sql_up = u'UPDATE %s SET freq=freq + 1 WHERE wid = ?' % self.freq_table
+    self.sql_up = u'UPDATE %s SET freq=freq + ? WHERE wid = ?' % self.freq_table
     self.sql_in = u'INSERT INTO %s VALUES (NULL, 1' % self.freq_table
     for i in range(self.fields):
       self.sql_sel = self.sql_sel + self.fieldnames[i] + u'=? AND '
       self.sql_in = self.sql_in + u', ?'
     self.sql_sel = self.sql_sel.rstrip(u' AND')
     self.sql_in = self.sql_in + u')'
+    # bulk query adding accumulated counts, relying on the UNIQUE constraint
+    fields = u', '.join(self.fieldnames)
+    self.sql_add = u'INSERT INTO %s (freq, %s) VALUES (?%s)\
+        ON CONFLICT (%s) DO UPDATE SET freq = freq + excluded.freq'\
+        % (self.freq_table, fields, u', ?' * self.fields, fields)
+    # bulk queries adding accumulated counts of the current document
+    self.sql_doc_add = u'INSERT INTO %s (did, wid, freq) \
+        SELECT ?, wid, ? FROM %s WHERE %s=?' \
+        % (self.docfreq_table, self.freq_table, u'=? AND '.join(self.fieldnames))
+    self.sql_doc_add = self.sql_doc_add + \
+        u' ON CONFLICT (did, wid) DO UPDATE SET freq = freq + excluded.freq'
+    self.sql_doc_add_wid = u'INSERT INTO %s (did, wid, freq) VALUES (?, ?, ?) \
+        ON CONFLICT (did, wid) DO UPDATE SET freq = freq + excluded.freq' \
+        % self.docfreq_table
+    self.sql_ngram_add = u'INSERT INTO %s (freq, w1, w2, w3) VALUES (?, ?, ?, ?) \
+        ON CONFLICT (w1, w2, w3) DO UPDATE SET freq = freq + excluded.freq' \
+        % self.ngram_table
+    self.sql_doc_ngram_add = u'INSERT INTO %s (did, freq, w1, w2, w3) \
+        VALUES (?, ?, ?, ?, ?) ON CONFLICT (did, w1, w2, w3) \
+        DO UPDATE SET freq = freq + excluded.freq' % self.docngram_table
 
+  """
+  Inserts a word if it is new and returns its id. The frequencies of
+  known words are only incremented in memory and written by
+  flush_increments, as every update also has to update the pos tree.
+  """
   def insert_word(self, fieldvalues):
-    # insert word if new word, otherwise update frequency
     self.c.execute(self.sql_sel, fieldvalues)
     row = self.c.fetchone()
+    self.rows = self.rows + 1
     if row == None: # word does not exist, insert
       self.c.execute(self.sql_in, fieldvalues)
-      return self.c.lastrowid
+      wid = self.c.lastrowid
     else: # update
       wid = row[0]
-      self.c.execute(self.sql_up, (wid,))
-      return wid
-  
+      self.increments[wid] = self.increments.get(wid, 0) + 1
+    if self.did != None:
+      self.doc_counts[wid] = self.doc_counts.get(wid, 0) + 1
+    return wid
+
+  """
+  Counts a word in memory without touching the database. The counts
+  are written by flush_words, which happens automatically as soon as
+  more than word_buffer distinct words have been collected.
+  """
+  def count_word(self, fieldvalues):
+    key = tuple(fieldvalues)
+    counts = self.counts
+    if key in counts:
+      counts[key] += 1
+    else:
+      counts[key] = 1
+      if len(counts) > self.word_buffer:
+        self.flush_words()
+
+  """ Adds a dict of word counts as collected by count_word. """
+  def add_counts(self, counts):
+    own = self.counts
+    for key, n in counts.iteritems():
+      own[key] = own.get(key, 0) + n
+    if len(own) > self.word_buffer:
+      self.flush_words()
+
+  """
+  Counts n-grams given as (w1, w2, w3) keys in memory. Like word counts
+  they are written by flush_words, and as soon as more than ngram_buffer
+  distinct n-grams have been collected, so memory use stays bounded.
+  """
+  def count_ngrams(self, keys):
+    counts = self.ngram_counts
+    for key in keys:
+      if key in counts:
+        counts[key] += 1
+      else:
+        counts[key] = 1
+    if len(counts) > self.ngram_buffer:
+      self.flush_ngrams()
+
+  """ Adds a dict of n-gram counts as collected by count_ngrams. """
+  def add_ngrams(self, counts):
+    own = self.ngram_counts
+    for key, n in counts.iteritems():
+      own[key] = own.get(key, 0) + n
+    if len(own) > self.ngram_buffer:
+      self.flush_ngrams()
+
+  def flush_ngrams(self):
+    if self.ngram_counts:
+      self.c.executemany(self.sql_ngram_add,
+          ((n,) + key for key, n in self.ngram_counts.iteritems()))
+      self.rows = self.rows + len(self.ngram_counts)
+      if self.did != None:
+        self.c.executemany(self.sql_doc_ngram_add,
+            ((self.did, n) + key for key, n in self.ngram_counts.iteritems()))
+      self.ngram_counts = {}
+
+  def flush_increments(self):
+    if self.increments:
+      self.c.executemany(self.sql_up,
+          ((n, wid) for wid, n in self.increments.iteritems()))
+      self.increments = {}
+
+  def flush_words(self):
+    self.flush_increments()
+    self.flush_ngrams()
+    # add all accumulated counts in one batch, sorted so that new words
+    # get the same ids however the counts were collected
+    if self.counts:
+      counts = sorted(self.counts.iteritems())
+      self.c.executemany(self.sql_add, ((n,) + key for key, n in counts))
+      self.rows = self.rows + len(counts)
+      if self.did != None:
+        self.c.executemany(self.sql_doc_add,
+            ((self.did, n) + key for key, n in counts))
+      self.counts = {}
+
+  def flush_document(self):
+    # add counts of words inserted by insert_word to the document
+    if self.doc_counts:
+      self.c.executemany(self.sql_doc_add_wid,
+          ((self.did, wid, n) for wid, n in self.doc_counts.iteritems()))
+      self.doc_counts = {}
+    if self.doc_sentences:
+      self.c.executemany(u'INSERT OR IGNORE INTO %s VALUES (?, ?)'
+          % self.docsentence_table,
+          ((self.did, sid) for sid in self.doc_sentences))
+      self.doc_sentences = set()
+    if self.last_sid != None:
+      self.c.execute(u'UPDATE %s SET last_sid = ? WHERE did = ?'
+          % self.file_table, (self.last_sid, self.did))
+
+  """
+  Inserts a sentence unless it is already stored, and records that the
+  current document contains it. Returns the sentence id and whether the
+  sentence is new, since the links of a known sentence do not need to
+  be inserted again.
+  """
   def insert_sentence(self, sentence):
-    sql = u'INSERT INTO %s VALUES (NULL, ?, ?)' % self.sentence_table
-    self.c.execute(sql, (sentence,len(sentence)))
-    return self.c.lastrowid
+    digest = hashlib.sha1(sentence.encode('utf-8')).digest()
+    key = struct.unpack('<q', digest[:8])[0]
+    sql = u'SELECT sid FROM %s WHERE hash = ? AND sentence = ?' % self.sentence_table
+    self.c.execute(sql, (key, sentence))
+    row = self.c.fetchone()
+    if row != None:
+      if self.did != None:
+        self.doc_sentences.add(row[0])
+      return (row[0], False)
+    sql = u'INSERT INTO %s VALUES (NULL, ?, ?, ?)' % self.sentence_table
+    self.c.execute(sql, (sentence, len(sentence), key))
+    self.rows = self.rows + 1
+    self.sentences = self.sentences + 1
+    self.last_sid = self.c.lastrowid
+    if self.did != None:
+      self.doc_sentences.add(self.last_sid)
+    return (self.last_sid, True)
+
+  def insert_links(self, word_ids, sentence_id, length):
+    sql = u'INSERT OR IGNORE INTO %s VALUES (?, ?, ?)' % self.link_table
+    self.c.executemany(sql, ((wid, length, sentence_id) for wid in word_ids))
+    self.rows = self.rows + len(word_ids)
+
+  """
+  Sets up the connection for inserting large amounts of data. Afterwards
+  the data is committed every config.commit_sentences sentences or
+  config.commit_seconds seconds, whichever comes first, when checkpoint
+  is called. Index creation is left to end_ingest.
+  """
+  def begin_ingest(self):
+    self.c.execute(u'PRAGMA journal_mode=WAL')
+    self.c.execute(u'PRAGMA synchronous=NORMAL')
+    self.c.execute(u'PRAGMA cache_size=%d' % -config.cache_size)
+    self.c.execute(u'PRAGMA temp_store=MEMORY')
+    self.c.execute(u'PRAGMA mmap_size=%d' % config.mmap_size)
+    self.rows = 0
+    self.sentences = 0
+    self.commit_time = time.time()
 
-  def insert_link(self, word_id, sentence_id):
-    sql = u'INSERT INTO %s VALUES (?, ?)' % self.link_table
-    self.c.execute(sql, (word_id, sentence_id))
+  """ Commits if enough sentences or time have passed since the last
+  commit. Counts accumulated by count_word are only committed when
+  they are flushed. """
+  def checkpoint(self):
+    if self.sentences >= config.commit_sentences \
+        or time.time() - self.commit_time >= config.commit_seconds:
+      self.commit()
+
+  def commit(self):
+    self.flush_increments()
+    if self.did != None:
+      self.flush_document()
+    self.bump_stamp()
+    start = time.time()
+    self.conn.commit()
+    end = time.time()
+    logger.out('committed %d rows in %.3f s (%.0f rows/s)'
+        % (self.rows, end - start, self.rows / max(end - self.commit_time, 1e-6)), 1)
+    self.rows = 0
+    self.sentences = 0
+    self.commit_time = end
+
+  """
+  Returns the manifest entry of the file at path as a tuple
+  (did, size, mtime, hash, committed), or None if it was never analysed.
+  """
+  def select_file(self, path):
+    self.c.execute(u'SELECT did, size, mtime, hash, committed FROM %s \
+        WHERE path = ?' % self.file_table, (path,))
+    return self.c.fetchone()
+
+  def update_file(self, did, size, mtime):
+    self.c.execute(u'UPDATE %s SET size = ?, mtime = ? WHERE did = ?'
+        % self.file_table, (size, mtime, did))
+
+  """
+  Starts analysing the file at path. Its previous counts and sentences
+  are removed first, so a changed or partially analysed file is never
+  counted twice. Until end_document, all counts are attributed to it.
+  """
+  def begin_document(self, path, size, mtime, digest):
+    row = self.select_file(path)
+    if row != None:
+      self.remove_document(row[0])
+    self.flush_words()
+    self.c.execute(u'SELECT max(sid) FROM %s' % self.sentence_table)
+    first_sid = (self.c.fetchone()[0] or 0) + 1
+    self.c.execute(u'INSERT INTO %s VALUES (NULL, ?, ?, ?, ?, 0, ?, NULL)'
+        % self.file_table, (path, size, mtime, digest, first_sid))
+    self.did = self.c.lastrowid
+    self.last_sid = None
+
+  def end_document(self):
+    self.flush_words()
+    self.flush_document()
+    self.c.execute(u'UPDATE %s SET committed = 1 WHERE did = ?'
+        % self.file_table, (self.did,))
+    self.commit()
+    self.did = None
+    self.last_sid = None
+
+  def remove_document(self, did):
+    logger.out('removing previous counts')
+    self.c.execute(u'UPDATE %s SET freq = freq - \
+        (SELECT d.freq FROM %s d WHERE d.did = ? AND d.wid = %s.wid) \
+        WHERE wid IN (SELECT wid FROM %s WHERE did = ?)'
+        % (self.freq_table, self.docfreq_table, self.freq_table,
+          self.docfreq_table), (did, did))
+    self.c.execute(u'DELETE FROM %s WHERE freq <= 0 \
+        AND wid IN (SELECT wid FROM %s WHERE did = ?)'
+        % (self.freq_table, self.docfreq_table), (did,))
+    # sentences are removed unless another document contains them too
+    self.c.execute(u'CREATE TEMP TABLE IF NOT EXISTS removed_sentences \
+        (sid INTEGER PRIMARY KEY)')
+    self.c.execute(u'DELETE FROM removed_sentences')
+    self.c.execute(u'INSERT INTO removed_sentences SELECT sid FROM %s d \
+        WHERE did = ? AND NOT EXISTS (SELECT 1 FROM %s o \
+          WHERE o.sid = d.sid AND o.did != d.did)'
+        % (self.docsentence_table, self.docsentence_table), (did,))
+    # links of the document's sentences can only be to its own words
+    self.c.execute(u'DELETE FROM %s WHERE wid IN (SELECT wid FROM %s WHERE did = ?) \
+        AND sid IN removed_sentences'
+        % (self.link_table, self.docfreq_table), (did,))
+    self.c.execute(u'DELETE FROM %s WHERE sid IN removed_sentences'
+        % self.sentence_table)
+    self.c.execute(u'DELETE FROM %s WHERE did = ?'
+        % self.docsentence_table, (did,))
+    self.c.execute(u'DELETE FROM %s WHERE did = ?'
+        % self.docfreq_table, (did,))
+    self.c.execute(u'UPDATE %s SET freq = freq - \
+        (SELECT d.freq FROM %s d WHERE d.did = ? AND d.w1 = %s.w1 \
+          AND d.w2 = %s.w2 AND d.w3 = %s.w3) \
+        WHERE (w1, w2, w3) IN (SELECT w1, w2, w3 FROM %s WHERE did = ?)'
+        % (self.ngram_table, self.docngram_table, self.ngram_table,
+          self.ngram_table, self.ngram_table, self.docngram_table), (did, did))
+    self.c.execute(u'DELETE FROM %s WHERE freq <= 0 \
+        AND (w1, w2, w3) IN (SELECT w1, w2, w3 FROM %s WHERE did = ?)'
+        % (self.ngram_table, self.docngram_table), (did,))
+    self.c.execute(u'DELETE FROM %s WHERE did = ?'
+        % self.docngram_table, (did,))
+    self.c.execute(u'DELETE FROM %s WHERE did = ?' % self.file_table, (did,))
+
+  def end_ingest(self):
+    self.flush_words()
+    self.commit()
+    logger.out('creating indexes')
+    self.create_indexes()
+    self.create_search_index()
+    for sql, plan in self.check_query_plans():
+      logger.err('query is not fully indexed: %s\n%s' % (sql, u'\n'.join(plan)))
 
   def drop_table(self):
+    self.counts = {}
+    self.increments = {}
+    self.ngram_counts = {}
+    self.doc_counts = {}
+    self.doc_sentences = set()
+    self.drop_search_index()
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.docsentence_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.docngram_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.ngram_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.stamp_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.wordtotal_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.postree_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.docfreq_table)
+    self.c.execute(u'DROP TABLE IF EXISTS %s' % self.file_table)
     self.c.execute(u'DROP TABLE IF EXISTS %s' % self.freq_table)
     self.c.execute(u'DROP TABLE IF EXISTS %s' % self.sentence_table)
     self.c.execute(u'DROP TABLE IF EXISTS %s' % self.link_table)
@@ -108,9 +750,23 @@ class Database():
     logger.out('dropped database tables')
 
   def clear_table(self):
+    self.counts = {}
+    self.increments = {}
+    self.ngram_counts = {}
+    self.doc_counts = {}
+    self.doc_sentences = set()
+    # the index is built again after the next ingest
+    self.drop_search_index()
+    self.c.execute(u'DELETE FROM %s' % self.docsentence_table)
+    self.c.execute(u'DELETE FROM %s' % self.docngram_table)
+    self.c.execute(u'DELETE FROM %s' % self.ngram_table)
+    self.c.execute(u'DELETE FROM %s' % self.docfreq_table)
+    self.c.execute(u'DELETE FROM %s' % self.file_table)
     self.c.execute(u'DELETE FROM %s' % self.freq_table)
     self.c.execute(u'DELETE FROM %s' % self.sentence_table)
     self.c.execute(u'DELETE FROM %s' % self.link_table)
+    self.c.execute(u'DELETE FROM %s' % self.postree_table)
+    self.bump_stamp()
     self.conn.commit()
     logger.out('cleared database tables')
 
@@ -121,6 +777,32 @@ class Database():
   The result is the total number of frequencies and unique number of words.
   """
   def select_frequencies(self, word, pos):
+    depth = self.postree_depth(pos)
+    if word == u'' and depth != None:
+      # totals of a node of the pos hierarchy are stored in the pos tree
+      (sql_sum, vals) = self.postree_query(pos, depth)
+    else:
+      (sql_sum, sql, vals) = self.frequency_query(word, pos)
+    def query_sum():
+      self.c.execute(sql_sum, vals)
+      return self.c.fetchone() or (None, 0)
+    return self.cached((u'sum', word, tuple(pos)), query_sum) # (fsum, rows)
+
+  """
+  Returns up to amount words selected like in select_frequencies as rows
+  (wid, freq, word, pos0, ...), ordered by frequency. The next page
+  starts after the (freq, wid) pair of the last row given as after.
+  """
+  def select_frequency_page(self, word, pos, amount, after=None):
+    (sql_sum, sql, vals) = self.frequency_query(word, pos, after != None)
+    if after != None:
+      vals = vals + list(after)
+    def query_page():
+      self.c.execute(sql, vals + [amount])
+      return self.c.fetchall()
+    return self.cached((u'words', word, tuple(pos), after, amount), query_page)
+
+  def frequency_query(self, word, pos, after=False):
     # create query
     sql_sum = u'SELECT sum(freq), count(freq)'
     sql = u'SELECT wid, freq'
@@ -130,51 +812,349 @@ class Database():
     # add FROM and WHERE part
     sql_f = u'\nFROM %s ' % self.freq_table
     (sql_w, vals) = self.where_query(word, pos)
-    sql = sql + sql_f + sql_w
     sql_sum = sql_sum + sql_f + sql_w
+    if after:
+      if sql_w:
+        sql_w = sql_w + u' AND (freq, wid) < (?, ?)'
+      else:
+        sql_w = u'\nWHERE (freq, wid) < (?, ?)'
+    sql = sql + sql_f + sql_w
     # add ordering
-    sql = sql + u'\nORDER BY freq DESC'
-    # get sum from sum query, then execute word query
-    self.c.execute(sql_sum, vals)
-    result = self.c.fetchone()
-    self.c.execute(sql, vals)
-    return result # (fsum, rows)
-  
+    sql = sql + u'\nORDER BY freq DESC, wid DESC\nLIMIT ?'
+    return (sql_sum, sql, vals)
+
   """
-  Selects sentences which contain the word with word id wid.
+  Returns up to amount sentences containing the word with id wid
+  as rows (sentence, len, sid), shortest first. The next page
+  starts after the (len, sid) pair of the last row given as after.
   """
-  def select_sentences(self, wid):
-    sql = u'SELECT DISTINCT sentence FROM %s NATURAL JOIN %s NATURAL JOIN %s\
-            WHERE wid = ?'\
-        % (self.freq_table, self.link_table, self.sentence_table)
-          # ORDER BY len ASC'\
-    self.c2.execute(sql, (wid,))
+  def select_sentence_page(self, wid, amount, after=None):
+    vals = [wid]
+    if after != None:
+      vals = vals + list(after)
+    def query_page():
+      self.c2.execute(self.sentence_query(after != None), vals + [amount])
+      return self.c2.fetchall()
+    return self.cached((u'sentences', wid, after, amount), query_page)
 
-  """ Returns amount rows from the sentence selection """
-  def select_frequency_results(self, amount):
-    return self.c.fetchmany(amount)
+  def sentence_query(self, after=False):
+    # the link table's key yields the sentences ordered by length
+    sql = u'SELECT sentence, l.len, l.sid FROM %s l JOIN %s s ON s.sid = l.sid\
+        \nWHERE l.wid = ?' % (self.link_table, self.sentence_table)
+    if after:
+      sql = sql + u' AND (l.len, l.sid) > (?, ?)'
+    return sql + u'\nORDER BY l.len ASC, l.sid ASC\nLIMIT ?'
+
+  """
+  Returns up to amount groups of the words selected like in
+  select_frequencies as rows (freq, words, word, pos0, ...), in which
+  the fields not in group are empty. The fields in group are either
+  word alone or pos0 to posk. Groups are ordered by their frequency
+  sum, and the next page starts after the row given as after.
+  """
+  def select_group_page(self, group, word, pos, amount, after=None):
+    (sql, vals) = self.group_query(group, word, pos, after != None)
+    if after != None:
+      vals = vals + [after[0]] + [after[self.fieldnames.index(name) + 2]
+          for name in group]
+    def query_page():
+      self.c.execute(sql, vals + [amount])
+      return self.c.fetchall()
+    return self.cached((u'groups', tuple(group), word, tuple(pos), after,
+      amount), query_page)
+
+  """
+  Creates the query for select_group_page. Groups of all words and of
+  pos prefixes below the selected pos values are read from the word
+  totals and the pos tree, other groups are summed from the freq table.
+  """
+  def group_query(self, group, word, pos, after=False):
+    depth = self.postree_depth(pos)
+    columns = [name if name in group else u"''" for name in self.fieldnames]
+    if group == [u'word'] and depth == 0:
+      sql = u'SELECT freq, variants, %s\nFROM %s' \
+          % (u', '.join(columns), self.wordtotal_table)
+      (sql_w, vals) = self.where_query(word, pos)
+      order = [u'freq', u'word']
+    elif group == self.fieldnames[1:len(group) + 1] and word == u'' \
+        and depth != None and depth <= len(group):
+      sql = u'SELECT freq, words, %s\nFROM %s' \
+          % (u', '.join(columns), self.postree_table)
+      (sql_w, vals) = self.where_query(word, pos)
+      sql_w = u'\nWHERE depth = ?' + sql_w.replace(u'\nWHERE', u' AND', 1)
+      vals = [len(group)] + vals
+      order = [u'freq'] + group
+    else:
+      sql = u'SELECT sum(freq) AS total, count(*), %s\nFROM %s' \
+          % (u', '.join(columns), self.freq_table)
+      (sql_w, vals) = self.where_query(word, pos)
+      sql_w = sql_w + u'\nGROUP BY ' + u', '.join(group)
+      order = [u'total'] + group
+    if after:
+      sql_w = sql_w + (u' HAVING ' if order[0] == u'total' else
+          u' AND ' if sql_w else u'\nWHERE ')
+      sql_w = sql_w + u'(%s) < (%s)' % (u', '.join(order),
+          u', '.join([u'?'] * len(order)))
+    sql = sql + sql_w + u'\nORDER BY ' + u' DESC, '.join(order) + u' DESC\nLIMIT ?'
+    return (sql, vals)
+
+  """ Returns the stamp of the freq table as a pair (created, changes),
+  see create_stamp, or None for tables of older versions. """
+  def select_stamp(self):
+    if not self.table_exists(self.stamp_table):
+      return None
+    self.c.execute(u'SELECT created, changes FROM %s' % self.stamp_table)
+    return self.c.fetchone()
+
+  """ Returns the number of words and a cursor over all words as rows
+  (freq, word, pos0, ...), most frequent first. """
+  def select_all_words(self):
+    self.c.execute(u'SELECT count(*) FROM %s' % self.freq_table)
+    rows = self.c.fetchone()[0]
+    self.c.execute(u'SELECT freq, %s FROM %s ORDER BY freq DESC, wid DESC'
+        % (u', '.join(self.fieldnames), self.freq_table))
+    return (rows, self.c)
+
+  """ Returns the completely analysed documents as rows (did, path). """
+  def select_documents(self):
+    self.c.execute(u'SELECT did, path FROM %s WHERE committed = 1 ORDER BY did'
+        % self.file_table)
+    return self.c.fetchall()
+
+  """ Returns the number of word counts of all documents and a cursor
+  over them as rows (did, wid, freq). """
+  def select_document_counts(self):
+    self.c.execute(u'SELECT count(*) FROM %s' % self.docfreq_table)
+    rows = self.c.fetchone()[0]
+    self.c.execute(u'SELECT did, wid, freq FROM %s' % self.docfreq_table)
+    return (rows, self.c)
+
+  """ Returns a dict of the words with the given ids as rows
+  (word, pos0, ...) by id. """
+  def select_words(self, wids):
+    wids = list(wids)
+    words = {}
+    # stay below the limit of query parameters
+    for i in range(0, len(wids), 500):
+      part = wids[i:i + 500]
+      self.c.execute(u'SELECT wid, %s FROM %s WHERE wid IN (%s)'
+          % (u', '.join(self.fieldnames), self.freq_table,
+            u', '.join([u'?'] * len(part))), part)
+      for row in self.c:
+        words[row[0]] = row[1:]
+    return words
+
+  """
+  Returns up to amount collocates of the root word, which are the roots
+  occurring next to it or with one word in between, as rows
+  (collocate, freq, pmi, t-score), ordered by t-score. Only collocates
+  occurring at least min_freq times are returned.
+  """
+  def select_collocates(self, word, amount, min_freq=3):
+    def query_collocates():
+      self.c.execute(u'SELECT freq FROM %s WHERE depth = 0' % self.postree_table)
+      row = self.c.fetchone()
+      if row == None:
+        return []
+      total = float(row[0])
+      self.c.execute(u'SELECT freq FROM %s WHERE word = ?'
+          % self.wordtotal_table, (word,))
+      row = self.c.fetchone()
+      if row == None:
+        return []
+      wfreq = row[0]
+      self.c.execute(self.collocate_query(), [word] * 4 + [min_freq])
+      results = []
+      for collocate, freq, cfreq in self.c.fetchall():
+        # four positions around the word, two on each side
+        expected = 4.0 * wfreq * cfreq / total
+        pmi = math.log(freq / expected, 2)
+        tscore = (freq - expected) / math.sqrt(freq)
+        results.append((collocate, freq, pmi, tscore))
+      results.sort(key=lambda r: -r[3])
+      return results[:amount]
+    return self.cached((u'collocates', word, amount, min_freq), query_collocates)
+
+  def collocate_query(self):
+    # collocates after and before the word, then with one word in between
+    sql = u"SELECT n.w, sum(n.f), t.freq FROM ( \
+        SELECT w2 AS w, freq AS f FROM %s WHERE w1 = ? AND w3 = '' \
+        UNION ALL SELECT w1, freq FROM %s WHERE w2 = ? AND w3 = '' \
+        UNION ALL SELECT w3, freq FROM %s WHERE w1 = ? AND w3 != '' \
+        UNION ALL SELECT w1, freq FROM %s WHERE w3 = ?) n \
+        JOIN %s t ON t.word = n.w \
+        GROUP BY n.w HAVING sum(n.f) >= ?" \
+        % ((self.ngram_table,) * 4 + (self.wordtotal_table,))
+    return sql
+
+  """
+  Returns up to amount sentences containing all the words with the ids
+  in wids as rows (sentence, len, sid), shortest first. The next page
+  starts after the (len, sid) pair of the last row given as after.
+  """
+  def select_word_sentence_page(self, wids, amount, after=None):
+    wids = list(wids)
+    vals = wids[:]
+    if after != None:
+      vals = vals + list(after)
+    def query_page():
+      self.c2.execute(self.word_sentence_query(len(wids), after != None),
+          vals + [amount])
+      return self.c2.fetchall()
+    return self.cached((u'word sentences', tuple(wids), after, amount),
+        query_page)
+
+  def word_sentence_query(self, words, after=False):
+    # sentences of the first word are checked for links to the others
+    sql = u'SELECT sentence, l.len, l.sid FROM %s l JOIN %s s ON s.sid = l.sid\
+        \nWHERE l.wid = ?' % (self.link_table, self.sentence_table)
+    for i in range(1, words):
+      sql = sql + u' AND EXISTS (SELECT 1 FROM %s m WHERE m.wid = ? \
+          AND m.len = l.len AND m.sid = l.sid)' % self.link_table
+    if after:
+      sql = sql + u' AND (l.len, l.sid) > (?, ?)'
+    return sql + u'\nORDER BY l.len ASC, l.sid ASC\nLIMIT ?'
+
+  """
+  Returns up to amount sentences containing all the space separated
+  terms of text as rows (sentence, len, sid), shortest first. The next
+  page starts after the (len, sid) pair of the last row given as after.
+  Terms of three or more characters are looked up in the trigram index,
+  shorter ones are only checked in the sentences found by those, or else
+  looked up in the index of characters and character pairs. If the terms
+  are frequent, or there is no full-text index, all sentences are checked
+  from the shortest on instead. Terms match case-sensitively either way.
+  """
+  def select_search_page(self, text, amount, after=None):
+    terms = text.split()
+    if not terms:
+      return []
+    def query_page():
+      (sql, vals) = self.search_query(terms, amount, after != None)
+      if after != None:
+        vals = vals + list(after)
+      self.c2.execute(sql, vals + [amount])
+      return self.c2.fetchall()
+    return self.cached((u'search', tuple(terms), after, amount), query_page)
+
+  def search_query(self, terms, amount, after=False):
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    vals = []
+    if long_terms and self.table_exists(self.search_table):
+      table = self.search_table
+      indexed = long_terms
+    elif short_terms and self.table_exists(self.gram_table):
+      table = self.gram_table
+      indexed = short_terms
+    else:
+      table = None
+    if table != None:
+      # each term is a phrase, which has to appear as it is
+      match = u' AND '.join([u'"%s"' % term.replace(u'"', u'""')
+        for term in indexed])
+      # all sentences found in the index are sorted, while checking the
+      # sentences from the shortest on stops after amount of them, which
+      # is faster once the matches exceed about sqrt(amount * sentences)
+      self.c3.execute(u'SELECT max(sid) FROM %s' % self.sentence_table)
+      limit = int(math.sqrt(amount * (self.c3.fetchone()[0] or 0))) + 1
+      self.c3.execute(u'SELECT count(*) FROM \
+          (SELECT 1 FROM %s WHERE %s MATCH ? LIMIT ?)' % (table, table),
+          (match, limit))
+      if self.c3.fetchone()[0] >= limit:
+        table = None
+    if table != None:
+      sql = u'SELECT s.sentence, s.len, s.sid FROM %s f \
+          JOIN %s s ON s.sid = f.rowid\nWHERE %s MATCH ?' \
+          % (table, self.sentence_table, table)
+      vals.append(match)
+    else:
+      sql = u'SELECT s.sentence, s.len, s.sid FROM %s s\nWHERE 1' \
+          % self.sentence_table
+    # both indexes fold case and find only some of the terms, so all of
+    # them are checked again in the sentences
+    for term in terms:
+      sql = sql + u' AND instr(s.sentence, ?) > 0'
+      vals.append(term)
+    if after:
+      sql = sql + u' AND (s.len, s.sid) > (?, ?)'
+    return (sql + u'\nORDER BY s.len ASC, s.sid ASC\nLIMIT ?', vals)
 
-  """ Returns amount rows from the sentence selection """
-  def select_sentences_results(self, amount):
-    return self.c2.fetchmany(amount)
-  
   """ Selects and returns possible pos options given by the
   current configuration of word and pos values, starting from index"""
   def select_options(self, word, pos, index):
+    if word == u'' and self.postree_depth(pos[:index]) == index \
+        and self.postree_depth(pos[index + 1:]) == 0:
+      # options below a node of the pos hierarchy are its children
+      (sql, vals) = self.postree_query(pos, index, True)
+    else:
+      (sql, vals) = self.options_query(word, pos, index)
+    def query_options():
+      self.c3.execute(sql, vals)
+      result = self.c3.fetchall()
+      # accumulate non-generic options
+      options = []
+      for r in result:
+        if r[0] != ALL:
+          options.append(r[0])
+      return options
+    return self.cached((u'options', word, tuple(pos), index), query_options)
+
+  """
+  Returns the cached result for key, or computes and caches it with
+  query. The cache is cleared whenever this or another connection has
+  changed the database since the last call.
+  """
+  def cached(self, key, query):
+    self.c3.execute(u'PRAGMA data_version')
+    version = (self.c3.fetchone()[0], self.conn.total_changes)
+    if version != self.cache_version:
+      self.cache.clear()
+      self.cache_version = version
+    result = self.cache.get(key)
+    if result == None:
+      result = query()
+      self.cache.put(key, result)
+    return result
+
+  def options_query(self, word, pos, index):
     # create the query
     sql = u'SELECT DISTINCT ' + self.fieldnames[index + 1]
     sql = sql + u'\nFROM %s ' % self.freq_table
     (sql_w, vals) = self.where_query(word, pos, index + 1)
     sql = sql + sql_w
     sql = sql + u'\nORDER BY ' + self.fieldnames[index + 1] + u' ASC'
-    self.c3.execute(sql, vals)
-    result = self.c3.fetchall()
-    # accumulate non-generic options
-    options = []
-    for r in result:
-      if r[0] != ALL:
-        options.append(r[0])
-    return options
+    return (sql, vals)
+
+  """ Returns the depth of the pos tree node selected by pos, or None
+  if the selected pos values are not a prefix of the hierarchy. """
+  def postree_depth(self, pos):
+    depth = 0
+    while depth < len(pos) and pos[depth] not in (ALL, u''):
+      depth = depth + 1
+    for value in pos[depth:]:
+      if value not in (ALL, u''):
+        return None
+    return depth
+
+  """ Creates the query for the (freq, words) totals of the pos tree
+  node of the given depth, or for the values of its children. """
+  def postree_query(self, pos, depth, children=False):
+    posnames = self.fieldnames[1:]
+    if children:
+      sql = u'SELECT %s FROM %s' % (posnames[depth], self.postree_table)
+      names = posnames[:depth]
+      vals = [depth + 1] + pos[:depth]
+    else:
+      sql = u'SELECT freq, words FROM %s' % self.postree_table
+      names = posnames
+      vals = [depth] + pos[:depth] + [u''] * (len(posnames) - depth)
+    sql = sql + u'\nWHERE depth = ?'
+    for name in names:
+      sql = sql + u' AND ' + name + u' = ?'
+    if children:
+      sql = sql + u'\nORDER BY ' + posnames[depth] + u' ASC'
+    return (sql, vals)
 
   """ utility to create the WHERE part of a query with the given
   field values, optionally excluding one """
@@ -192,6 +1172,12 @@ class Database():
     return (sql, vals)
   
   def __exit__(self, typ, value, traceback):
+    self.flush_words()
+    # the counts of an interrupted document are kept with it, so that
+    # they are removed when it is analysed again
+    if self.did != None:
+      self.flush_document()
+    self.bump_stamp()
     self.c.close()
     self.c2.close()
     self.c3.close()
@@ -199,3 +1185,14 @@ class Database():
     self.conn.close()
     logger.out('disconnected from database')
 
+""" Returns the characters and pairs of adjacent characters of sentence,
+separated by spaces, which are the tokens of the index of short search
+terms. White space is left out, as search terms never contain it. """
+def search_grams(sentence):
+  grams = []
+  for i in range(len(sentence)):
+    if not sentence[i].isspace():
+      grams.append(sentence[i])
+      if i + 1 < len(sentence) and not sentence[i + 1].isspace():
+        grams.append(sentence[i:i + 2])
+  return u' '.join(grams)
@@ -4,11 +4,10 @@ formats.py: This file contains formatter for converting specially
 formatted files into plain texts.
 """
 
-import os.path
 import csv
 import re
 
-import config
+import gaiji
 from logger import logger
 
 """
@@ -18,23 +17,6 @@ and returns exactly the same text.
 class Format(object):
   def __init__(self):
     self.linecount = 0
-    # load gaiji codes
-    self.gaiji_codes = {}
-    gaijifile = os.path.join(config.get_basedir(), config.gaijifile)
-    try:
-      fp = open(gaijifile, 'r')
-    except IOError as e:
-      logger.err('error opening gaiji codes file: %s' % (filename, e))
-    else:
-      with fp:
-        for line in fp:
-          match = re.match(ur'^0x(?P<JisCode>[0-9A-Fa-f]+)\tU\+(?P<UtfCode>[0-9a-fA-F]+)\+?(?P<UtfCode2>[0-9a-fA-F]+)?', line)
-          if match:
-            gaiji_code = int(match.group('JisCode'), 16)
-            utf_char = unichr(int(match.group('UtfCode'), 16))
-            if match.group('UtfCode2'): # 2-character representation
-              utf_char = utf_char + unichr(int(match.group('UtfCode2'), 16))
-            self.gaiji_codes[gaiji_code] = utf_char
 
   def replace_gaiji(self, gaiji_match):
     jis_plane = int(gaiji_match.group('JisPlane'))
@@ -43,12 +25,12 @@ class Format(object):
     gaiji_code = 0x100 * (jis_row + 0x20) + (jis_col + 0x20)
     if jis_plane == 2:
       gaiji_code = gaiji_code + 0x8080
-    try:
-      #logger.err('replaced %s with %s' % (gaiji_match.group(0), self.gaiji_codes[gaiji_code]))
-      return self.gaiji_codes[gaiji_code]
-    except KeyError:
+    # the table of gaiji codes is loaded on the first lookup
+    utf_char = gaiji.lookup(gaiji_code)
+    if utf_char == None:
       logger.err('found gaiji with no equivalent: %s' % gaiji_match.group(0))
       return u''
+    return utf_char
 
   def new_file(self):
     self.linecount = 0
@@ -64,6 +46,13 @@ Gaiji constructs are replaced with UTF-8 equivalents and
 other formatting constructs are deleted.
 """
 class AozoraFormat(Format):
+  # postscript lines, after which the text is skipped
+  postscript_pattern = re.compile(ur'\s*(底本|このテキストは|本書は|初出)')
+  # all markup handled in a single pass: annotations (including gaiji and
+  # the alteration mark), HTML (for images), furigana and furigana markers
+  markup_pattern = re.compile(ur'※?［＃.*?］|<.*?>|《.*?》|｜')
+  gaiji_pattern = re.compile(ur'※?［＃[^］]*?(?P<JisPlane>\d)\-(?P<JisRow>\d{1,2})\-(?P<JisCol>\d{1,2})］')
+
   def __init__(self):
     super(AozoraFormat, self).__init__()
     self.skip = False
@@ -72,33 +61,36 @@ class AozoraFormat(Format):
     Format.new_file(self)
     self.skip = False
 
+  def replace_markup(self, match):
+    markup = match.group(0)
+    if markup[-1] != u'］':
+      return u''
+    # replace gaiji and the alteration mark, remove other annotations
+    gaiji_match = self.gaiji_pattern.match(markup)
+    if gaiji_match:
+      return self.replace_gaiji(gaiji_match)
+    if markup in (u'［＃歌記号］', u'※［＃歌記号］'):
+      return u'〽'
+    return u''
+
   def trim(self, line):
     Format.trim(self, line)
     # look for comment in first 30 lines
-    if re.match (ur'----------', line):
+    if line.startswith(u'----------'):
       if self.skip:
         self.skip = False
         return u''
       elif self.linecount <= 30:
         self.skip = True
     # look for postscript
-    if re.match (ur'\s*(底本|このテキストは|本書は|初出)', line):
+    if self.postscript_pattern.match(line):
       self.skip = True
     # if in skip mode, ignore line
     if self.skip:
       return u''
-    # replace gaiji
-    line = re.sub(ur'※?［＃[^］]*?(?P<JisPlane>\d)\-(?P<JisRow>\d{1,2})\-(?P<JisCol>\d{1,2})］', self.replace_gaiji, line)
-    # handle the alteration mark
-    line = re.sub(ur'※?［＃歌記号］', u'〽', line);
-    # remove other Aozora constructs
-    line = re.sub(ur'※?［＃.*?］', u'', line);
-    # remove HTML (for images)
-    line = re.sub(ur'<.*?>', u'', line);
-    # remove furigana
-    line = re.sub(ur'《.*?》', u'', line);
-    line = re.sub(ur'｜', u'', line);
+    # replace markup, unless the line cannot contain any
+    if u'［' in line or u'<' in line or u'《' in line or u'｜' in line:
+      line = self.markup_pattern.sub(self.replace_markup, line)
     # remove whitespace
     line = line.strip()
     return line
-
@@ -54,12 +54,11 @@ def main():
       if not re.match(r'^[_a-zA-Z][_a-zA-Z0-9]*$', tablename):
         logger.err('invalid table name: %s' % tablename)
         sys.exit(2)
-  # open gui with database
+  # open gui with database, which is connected by its query thread
   try:
     db = database.Database(tablename)
-    with db:
-      ui = gui.FreqGUI(db, list_number)
-      ui.show()
+    ui = gui.FreqGUI(db, list_number)
+    ui.show()
   except sqlite3.Error as e:
     logger.err('database error: %s' % e)
 
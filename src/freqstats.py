@@ -0,0 +1,122 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+This is the Frequency Statistics tool.
+It uses the database created by the Japanese Novel Analyser and
+prints statistics of the frequencies: type/token figures, how much of
+the text the most frequent words cover, a fit of Zipf's law and the
+breakdown by part of speech. The frequencies are cached in data/columns
+for fast repeated use.
+
+Usage: freqstats.py [OPTION]...
+Print statistics of the frequencies in the database
+
+-t, --tablename     Table to use
+-p, --pos=POS,...   Only count words with these parts of speech;
+                    use * to select any value of a level
+-l, --level=N       Break down by the first N levels of pos (default 1)
+-c, --coverage=N,.. Print coverage of the top N words
+                    (default 10,100,1000,10000)
+-r, --refresh       Rebuild the cache even if the table is unchanged
+"""
+
+import sys
+import getopt
+import sqlite3
+import re
+import time
+
+import database
+import columns
+import config
+from logger import logger
+
+def main():
+  # parse command line options
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'ht:p:l:c:r', ['help', 'tablename=', 'pos=', 'level=', 'coverage=', 'refresh'])
+  except getopt.error as opterr:
+    logger.err(opterr)
+    logger.err('for help use --help')
+    sys.exit(2)
+  # process config and options
+  tablename = config.tablename
+  pos = [config.ALL]*config.mecab_fields
+  level = 1
+  ranks = [10, 100, 1000, 10000]
+  refresh = False
+  for o, a in opts:
+    if o in ('-h', '--help'):
+      logger.out(__doc__)
+      sys.exit(0)
+    if o in ('-t', '--tablename'):
+      tablename = a
+      if not re.match(r'^[_a-zA-Z][_a-zA-Z0-9]*$', tablename):
+        logger.err('invalid table name: %s' % tablename)
+        sys.exit(2)
+    if o in ('-p', '--pos'):
+      values = a.decode('utf-8').split(u',')
+      if len(values) > config.mecab_fields:
+        logger.err('too many pos values: %s' % a)
+        sys.exit(2)
+      pos = values + [config.ALL]*(config.mecab_fields - len(values))
+    if o in ('-l', '--level'):
+      try:
+        level = int(a)
+      except ValueError:
+        logger.err('invalid argument for level: %s' % a)
+        sys.exit(2)
+      if level < 0 or level > config.mecab_fields:
+        logger.err('invalid level: %s' % level)
+        sys.exit(2)
+    if o in ('-c', '--coverage'):
+      try:
+        ranks = [int(n) for n in a.split(',')]
+      except ValueError:
+        logger.err('invalid argument for coverage: %s' % a)
+        sys.exit(2)
+    if o in ('-r', '--refresh'):
+      refresh = True
+  try:
+    db = database.Database(tablename)
+    with db:
+      start = time.time()
+      cols = columns.FrequencyColumns(db, refresh)
+      logger.out('loaded %d words in %.3f s' % (len(cols.freq), time.time() - start))
+  except sqlite3.Error as e:
+    logger.err('database error: %s' % e)
+    sys.exit(1)
+  start = time.time()
+  stats = columns.FrequencyStats(cols, cols.select(pos))
+  report(stats, level, ranks)
+  logger.out('computed statistics in %.3f s' % (time.time() - start))
+
+def report(stats, level, ranks):
+  entries, words, tokens, hapax = stats.types()
+  logger.out(u'%d tokens, %d distinct words, %d distinct by word and pos'
+      % (tokens, words, entries))
+  if tokens == 0:
+    return
+  logger.out(u'type/token ratio %.4f, %d hapax legomena (%.1f%% of words)'
+      % (float(words) / tokens, hapax, 100.0 * hapax / max(entries, 1)))
+  coverage = stats.coverage()
+  for n in ranks:
+    if 0 < n <= len(coverage):
+      logger.out(u'top %d words cover %.2f%% of the text'
+          % (n, 100.0 * coverage[n - 1]))
+  for fraction in (0.5, 0.8, 0.9, 0.95):
+    logger.out(u'%.0f%% of the text is covered by the top %d words'
+        % (100 * fraction, stats.words_for_coverage(fraction)))
+  s, c, r2 = stats.zipf()
+  logger.out(u'zipf fit: freq = %.1f / rank^%.3f (r2 = %.3f)' % (c, s, r2))
+  for i in range(level):
+    name = u'pos' + str(i)
+    logger.out(u'\nbreakdown by %s:' % name)
+    for value, count, total in stats.breakdown(name):
+      line = u'%-12s %8d words %10d tokens %6.2f%%' \
+          % (value, count, total, 100.0 * total / tokens)
+      logger.out(line.encode('utf-8'))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,85 @@
+"""
+gaiji.py: This file provides the table of gaiji codes, which maps
+JIS X 0213 codes to unicode characters. The table is parsed from the
+text file once and then kept as a marshal file, which loads much
+faster. It is loaded on the first lookup and then shared by all
+formatters of the process.
+"""
+
+import os
+import os.path
+import re
+import marshal
+import tempfile
+
+import config
+from logger import logger
+
+# table of gaiji codes, None until the first lookup
+table = None
+
+""" Returns the characters of the JIS X 0213 code, or None if the code
+is not in the table. """
+def lookup(code):
+  global table
+  if table == None:
+    table = load()
+  return table.get(code)
+
+""" Returns the table from the cache, compiling the cache first if it
+is missing or older than the text file. """
+def load():
+  gaijifile = os.path.join(config.get_basedir(), config.gaijifile)
+  cachefile = os.path.join(config.get_basedir(), config.gaijicache)
+  try:
+    stat = os.stat(gaijifile)
+  except OSError as e:
+    logger.err('error opening gaiji codes file: %s' % e)
+    return {}
+  # the cache is valid for this text file and marshal version
+  stamp = (stat.st_size, stat.st_mtime, marshal.version)
+  try:
+    with open(cachefile, 'rb') as fp:
+      cached_stamp, codes = marshal.load(fp)
+    if cached_stamp == stamp:
+      return codes
+  except (IOError, EOFError, ValueError, TypeError):
+    pass
+  codes = parse(gaijifile)
+  # written to a temporary file first, so that other processes never
+  # read a partial cache
+  try:
+    fd, tempname = tempfile.mkstemp(dir=os.path.dirname(cachefile))
+  except OSError as e:
+    logger.err('could not write gaiji cache: %s' % e)
+    return codes
+  try:
+    with os.fdopen(fd, 'wb') as fp:
+      marshal.dump((stamp, codes), fp)
+    # mkstemp makes the file private
+    os.chmod(tempname, 0644)
+    os.rename(tempname, cachefile)
+  except (IOError, OSError) as e:
+    logger.err('could not write gaiji cache: %s' % e)
+    os.remove(tempname)
+  return codes
+
+""" Parses the text file of gaiji codes. """
+def parse(gaijifile):
+  codes = {}
+  pattern = re.compile(ur'^0x(?P<JisCode>[0-9A-Fa-f]+)\tU\+(?P<UtfCode>[0-9a-fA-F]+)\+?(?P<UtfCode2>[0-9a-fA-F]+)?')
+  try:
+    fp = open(gaijifile, 'r')
+  except IOError as e:
+    logger.err('error opening gaiji codes file: %s' % e)
+    return codes
+  with fp:
+    for line in fp:
+      match = pattern.match(line)
+      if match:
+        gaiji_code = int(match.group('JisCode'), 16)
+        utf_char = unichr(int(match.group('UtfCode'), 16))
+        if match.group('UtfCode2'): # 2-character representation
+          utf_char = utf_char + unichr(int(match.group('UtfCode2'), 16))
+        codes[gaiji_code] = utf_char
+  return codes
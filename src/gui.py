@@ -2,14 +2,20 @@
 
 """
 gui.py: This is the graphical user interface. It displays the frequency
-lists, allows selection by part-of-speech (pos) and sub-pos. Clicking
-on a word opens a window displaying sentences containing that word.
+lists, allows selection by part-of-speech (pos) and sub-pos, and
+grouping by word or pos. Clicking on a word opens a window displaying
+sentences containing that word and its most significant collocates,
+where all sentences can be searched for text as well.
+All queries run in a background thread, see query.py.
 """
 
 import gtk
 import gobject
 
 import config
+import query
+
+gobject.threads_init()
 
 """ GTK View for having a list with scroll bars that can dynamically
 load new entries. Has signals for clicking on an entry and clicking
@@ -72,11 +78,15 @@ gobject.type_register(ExtendedView)
 class FreqGUI():
   def __init__(self, db, listsize):
     self.database = db
+    self.queries = query.QueryThread(db)
+    self.queries.start()
     self.listsize = listsize
     self.wordstore = []
     self.freqmode = 0
+    self.group = None
     self.select_position = 0
     self.word = u''
+    self.search = u''
     self.posvalues = [config.ALL]*config.mecab_fields
     self.update_mode = False
     self.create_layout()
@@ -99,22 +109,96 @@ class FreqGUI():
     self.sentenceview = ExtendedView(str)
     self.sentenceview.add_column(u'Sentences', 0)
     self.sentenceview.connect('row-extended', self.load_sentences)
-    self.sentence_window.add(self.sentenceview)
+    # search box above the sentences, searching all sentences
+    self.search_entry = gtk.Entry()
+    self.search_entry.connect('activate', self.changed_search)
+    searchbox = gtk.HBox(False, 5)
+    searchbox.pack_start(gtk.Label(u'Search:'), False)
+    searchbox.pack_start(self.search_entry, True, True)
+    sentencebox = gtk.VBox(False, 5)
+    sentencebox.pack_start(searchbox, False)
+    sentencebox.pack_start(self.sentenceview, True, True)
+    # collocates of the word next to the sentences
+    self.collocateview = ExtendedView(str, int, str, str)
+    self.collocateview.add_column(u'Collocate', 0)
+    self.collocateview.add_column(u'Frequency', 1)
+    self.collocateview.add_column(u'PMI', 2)
+    self.collocateview.add_column(u'T-score', 3)
+    paned = gtk.HPaned()
+    paned.pack1(sentencebox, True, True)
+    paned.pack2(self.collocateview, False, True)
+    paned.set_position(500)
+    self.sentence_window.add(paned)
 
   def display_sentences(self, view, index):
-    wid = self.viewstore[index][0]
-    sentences = self.database.select_sentences(wid)
+    if self.group:
+      return # groups have no sentences of their own
+    self.sentence_wid = self.viewstore[index][0]
+    self.search = u''
+    self.search_entry.set_text(u'')
+    self.last_sentence = None
     self.sentenceview.clear()
     self.load_sentences(self.sentenceview)
+    self.collocateview.clear()
+    word, amount = self.viewstore[index][2], self.listsize
+    self.request(u'collocates',
+        lambda db: db.select_collocates(word, amount),
+        self.add_collocates)
     self.sentence_window.show_all()
 
+  def add_collocates(self, results):
+    for collocate, freq, pmi, tscore in results:
+      self.collocateview.append((collocate, freq, u'%.2f' % pmi,
+        u'%.2f' % tscore))
+
+  def changed_search(self, entry):
+    self.search = entry.get_text().decode('utf-8').strip()
+    self.last_sentence = None
+    self.sentenceview.clear()
+    self.load_sentences(self.sentenceview)
+
   def load_sentences(self, view):
-    results = self.database.select_sentences_results(self.listsize)
+    amount, after = self.listsize, self.last_sentence
+    if self.search:
+      text = self.search
+      query = lambda db: db.select_search_page(text, amount, after)
+    else:
+      wid = self.sentence_wid
+      query = lambda db: db.select_sentence_page(wid, amount, after)
+    def failed():
+      # the 'Load more' row is removed when it is activated
+      if after != None:
+        view.append((u'Load more…',), True)
+    self.request(u'sentences', query, self.add_sentences, failed)
+
+  def add_sentences(self, results):
+    view = self.sentenceview
     for r in results:
       view.append((r[0],))
+    if results:
+      self.last_sentence = (r[1], r[2])
     if len(results) >= self.listsize:
       view.append((u'Load more…',), True)
 
+  """ Submits query to the query thread on channel, showing the
+  spinner until all submitted queries have returned. If the query
+  fails, the error is shown and failed is called instead of callback,
+  so that a removed 'Load more' row can be restored. """
+  def request(self, channel, query, callback, failed=None):
+    def done(result, error):
+      if not self.queries.busy():
+        self.spinner.stop()
+        self.spinner.hide()
+      if error != None:
+        self.status.push(0, u'Query failed: %s' % error)
+        if failed:
+          failed()
+      else:
+        callback(result)
+    self.spinner.show()
+    self.spinner.start()
+    self.queries.submit(channel, query, done)
+
   def create_layout(self):
     # main window
     self.window = self.create_window('Frequency Browser')
@@ -131,9 +215,14 @@ class FreqGUI():
     topbox = gtk.VBox(False, 10)
     hbox = gtk.HBox(True, 10)
     self.status = gtk.Statusbar()
+    self.spinner = gtk.Spinner()
+    self.spinner.set_no_show_all(True)
+    statusbox = gtk.HBox(False, 5)
+    statusbox.pack_start(self.spinner, False, False)
+    statusbox.pack_start(self.status, True, True)
     topbox.pack_start(hbox, False, False)
     topbox.pack_start(self.view, True, True)
-    topbox.pack_start(self.status, False, False)
+    topbox.pack_start(statusbox, False, False)
     self.window.add(topbox)
     # create selection vars
     # frequency display selection box
@@ -148,6 +237,20 @@ class FreqGUI():
     vbox.pack_start(lb, False, False, 0)
     vbox.pack_start(cb, False, False, 0)
     hbox.pack_start(vbox, True, True, 0)
+    # grouping selection box
+    vbox = gtk.VBox(False, 0)
+    lb = gtk.Label('Group by')
+    cb = gtk.combo_box_new_text()
+    cb.append_text('None')
+    cb.append_text('Word')
+    for i in range(config.mecab_fields):
+      cb.append_text('POS 1-' + str(i + 1))
+    cb.set_active(0)
+    cb.set_size_request(50, -1)
+    cb.connect('changed', self.changed_group)
+    vbox.pack_start(lb, False, False, 0)
+    vbox.pack_start(cb, False, False, 0)
+    hbox.pack_start(vbox, True, True, 0)
     # word selection box
     vbox = gtk.VBox(False, 0)
     lb = gtk.Label('Word')
@@ -193,9 +296,10 @@ class FreqGUI():
       if i == self.select_position and \
           (self.select_position == 0 or\
            self.posvalues[self.select_position - 1] != config.ALL):
-        options = self.database.select_options(self.word, self.posvalues, i)
-        for opt in options:
-          store.append((opt,))
+        word, pos = self.word, list(self.posvalues)
+        self.request(u'options',
+            lambda db, i=i: db.select_options(word, pos, i),
+            lambda options, store=store: self.add_options(store, options))
         cb.set_sensitive(True)
       else:
         cb.set_sensitive(False)
@@ -203,31 +307,74 @@ class FreqGUI():
       cb.show()
     self.update_mode = False
 
-  def update_list(self):
-    result = self.database.select_frequencies(self.word, self.posvalues)
-    self.dsum = 0
-    self.fsum = result[0]
-    rows = result[1]
-    self.status.push(0, u'Query matches %s unique words appearing a total of %s times.' % (rows, self.fsum))
+  def add_options(self, store, options):
+    for opt in options:
+      store.append((opt,))
 
+  def update_list(self):
     self.view.clear()
     self.viewstore = []
-    self.load_words(self.view)
+    self.last_word = None
+    # the sum and the first page are queried together
+    word, pos = self.word, list(self.posvalues)
+    page = self.page_query(None)
+    self.queries.cancel(u'prefetch')
+    self.request(u'words',
+        lambda db: (db.select_frequencies(word, pos), page(db)),
+        self.display_list)
+
+  """ Returns the query for the page of words, or of groups if
+  grouping is selected, which follows after. """
+  def page_query(self, after):
+    word, pos, amount = self.word, list(self.posvalues), self.listsize
+    group = self.group
+    if group:
+      return lambda db: db.select_group_page(group, word, pos, amount, after)
+    return lambda db: db.select_frequency_page(word, pos, amount, after)
+
+  def display_list(self, result):
+    self.dsum = 0
+    self.fsum = result[0][0]
+    rows = result[0][1]
+    cache = self.database.cache
+    self.status.push(0, u'Query matches %s unique words appearing a total of %s times. (Cache: %s hits, %s misses)' % (rows, self.fsum, cache.hits, cache.misses))
+    self.add_words(result[1])
 
   def load_words(self, view):
-    results = self.database.select_frequency_results(self.listsize)
+    self.request(u'words', self.page_query(self.last_word), self.add_words,
+        self.add_extender)
+
+  def add_words(self, results):
+    view = self.view
+    if results:
+      if self.group:
+        self.last_word = results[-1]
+      else:
+        self.last_word = (results[-1][1], results[-1][0])
     for r in results:
-      rl = list(r)[1:]
+      if self.group:
+        # rows of groups have the word count in place of the word id
+        rl = [r[0]] + list(r)[2:]
+      else:
+        rl = list(r)[1:]
       self.dsum = self.dsum + rl[0] 
       if not self.freqmode:
         rl[0] = 100.00 * rl[0] / self.fsum
       view.append(rl)
       self.viewstore.append(r)
     if len(results) >= self.listsize:
-      remaining = self.fsum - self.dsum
-      if not self.freqmode:
-        remaining = 100.00 * remaining / self.fsum
-      view.append([remaining, u'Load more…'] + [u'']*config.mecab_fields, True)
+      self.add_extender()
+      # fetch the next page into the result cache while the user reads
+      self.request(u'prefetch', self.page_query(self.last_word),
+          lambda result: None)
+
+  """ Appends the row loading the next page of words. """
+  def add_extender(self):
+    remaining = self.fsum - self.dsum
+    if not self.freqmode:
+      remaining = 100.00 * remaining / self.fsum
+    self.view.append([remaining, u'Load more…'] + [u'']*config.mecab_fields,
+        True)
 
   def delete_event(self, window, event, data=None):
     if window == self.sentence_window:
@@ -239,6 +386,7 @@ class FreqGUI():
       return False
 
   def destroy(self, widget, data=None):
+    self.queries.stop()
     gtk.main_quit()
 
   def update(self):
@@ -259,6 +407,16 @@ class FreqGUI():
       self.view.set_column_title(0, u'Frequency (%)')
     self.update()
 
+  def changed_group(self, groupbox):
+    index = groupbox.get_active()
+    if index == 0:
+      self.group = None
+    elif index == 1:
+      self.group = [u'word']
+    else:
+      self.group = [u'pos' + str(i) for i in range(index - 1)]
+    self.update_list()
+
   def changed_pos(self, combobox, number):
     if not self.update_mode:
       self.select_position = number + 1
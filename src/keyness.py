@@ -0,0 +1,125 @@
+"""
+keyness.py: This file compares the word frequencies of single documents,
+or of groups of documents, with the rest of the corpus. The counts of
+all documents are loaded into a sparse matrix, and the scores of all
+words in all documents are computed at once on its non-zero entries.
+"""
+
+import os.path
+import itertools
+
+import numpy
+from scipy import sparse
+
+"""
+Returns the label of the group of a document. Documents are compared
+one by one, or grouped by the directory they are in, which with the
+layout of Aozora Bunko is one directory per author.
+"""
+def group_label(path, by):
+  if by == 'directory':
+    return os.path.dirname(path)
+  return path
+
+"""
+Word counts of a corpus partitioned into documents or groups of
+documents. counts is a sparse matrix with a row for each entry of
+labels and a column for each entry of wids.
+"""
+class Corpus():
+  def __init__(self, db, by='document'):
+    # number the groups of the documents
+    self.labels = []
+    groups = {}
+    rowof = {}
+    for did, path in db.select_documents():
+      label = group_label(path, by)
+      if label not in groups:
+        groups[label] = len(self.labels)
+        self.labels.append(label)
+      rowof[did] = groups[label]
+    # read all counts as flat arrays
+    (size, cursor) = db.select_document_counts()
+    data = numpy.fromiter(itertools.chain.from_iterable(cursor),
+        numpy.int64, size * 3).reshape(size, 3)
+    dids = data[:, 0]
+    # counts of documents which were not completely analysed are ignored
+    lookup = numpy.full(max(dids.max() if size else 0, max(rowof or [0])) + 1,
+        -1, numpy.int64)
+    for did, row in rowof.iteritems():
+      lookup[did] = row
+    rows = lookup[dids]
+    valid = rows >= 0
+    self.wids, columns = numpy.unique(data[valid, 1], return_inverse=True)
+    # entries of the same row and column are summed up
+    self.counts = sparse.csr_matrix((data[valid, 2], (rows[valid], columns)),
+        shape=(len(self.labels), len(self.wids)), dtype=numpy.float64)
+    self.counts.sum_duplicates()
+    self.sizes = numpy.asarray(self.counts.sum(axis=1)).ravel()
+    self.totals = numpy.asarray(self.counts.sum(axis=0)).ravel()
+    self.total = self.sizes.sum()
+
+  """ Returns the row of each non-zero entry of counts. """
+  def entry_rows(self):
+    return numpy.repeat(numpy.arange(len(self.labels)),
+        numpy.diff(self.counts.indptr))
+
+  """
+  Returns the observed frequencies of each non-zero entry: a in its
+  row and b in all other rows, with the sizes c of its row and d of
+  all other rows.
+  """
+  def contingency(self):
+    a = self.counts.data
+    b = self.totals[self.counts.indices] - a
+    c = self.sizes[self.entry_rows()]
+    d = self.total - c
+    return (a, b, c, d)
+
+  """ Returns a sparse matrix like counts with values in place of its
+  non-zero entries. """
+  def scores(self, values):
+    return sparse.csr_matrix((values, self.counts.indices.copy(),
+      self.counts.indptr.copy()), shape=self.counts.shape)
+
+  """
+  Returns the log-likelihood keyness of every word in every row, which
+  is positive if the word is more frequent in the row than in the rest
+  of the corpus, and negative if it is less frequent.
+  """
+  def log_likelihood(self):
+    (a, b, c, d) = self.contingency()
+    e1 = c * (a + b) / self.total
+    e2 = d * (a + b) / self.total
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      ll = a * numpy.log(a / e1)
+      ll = ll + numpy.where(b > 0, b * numpy.log(b / e2), 0)
+    ll = 2 * ll
+    return self.scores(numpy.where(a * d >= b * c, ll, -ll))
+
+  """ Returns the chi-squared keyness of every word in every row, with
+  the same sign as log_likelihood. """
+  def chi_squared(self):
+    (a, b, c, d) = self.contingency()
+    n = self.total
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      chi2 = n * (a * (d - b) - b * (c - a)) ** 2 \
+          / (c * d * (a + b) * (n - a - b))
+    chi2 = numpy.nan_to_num(chi2)
+    return self.scores(numpy.where(a * d >= b * c, chi2, -chi2))
+
+  """ Returns the tf-idf of every word in every row, with the term
+  frequency relative to the size of the row. """
+  def tfidf(self):
+    df = numpy.bincount(self.counts.indices, minlength=len(self.wids))
+    idf = numpy.log(float(len(self.labels)) / numpy.maximum(df, 1))
+    tf = self.counts.data / self.sizes[self.entry_rows()]
+    return self.scores(tf * idf[self.counts.indices])
+
+  """ Returns the n highest scores of row as pairs (wid, score). """
+  def top(self, scores, row, n):
+    start, end = scores.indptr[row], scores.indptr[row + 1]
+    values = scores.data[start:end]
+    order = numpy.argsort(-values, kind='mergesort')[:n]
+    columns = scores.indices[start:end][order]
+    return zip(self.wids[columns].tolist(), values[order].tolist())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+This is the Keyword tool.
+It uses the database created by the Japanese Novel Analyser and
+prints the words which are characteristic of each analysed document,
+or of each directory of documents, compared with the whole corpus.
+
+Usage: keywords.py [OPTION]... [NAME]...
+Print the keywords of the documents or directories containing NAME,
+or of all of them if no NAME is given
+
+-t, --tablename       Table to use
+-m, --measure=MEASURE Rank words by MEASURE, which is 'll' for
+                      log-likelihood (default), 'chi2' for chi-squared
+                      or 'tfidf'
+-d, --directories     Compare directories instead of single documents
+-n, --number=N        Print the top N words of each (default 20)
+"""
+
+import sys
+import getopt
+import sqlite3
+import re
+import time
+
+import database
+import keyness
+import config
+from logger import logger
+
+def main():
+  # parse command line options
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'ht:m:dn:', ['help', 'tablename=', 'measure=', 'directories', 'number='])
+  except getopt.error as opterr:
+    logger.err(opterr)
+    logger.err('for help use --help')
+    sys.exit(2)
+  # process config and options
+  tablename = config.tablename
+  measure = 'll'
+  by = 'document'
+  number = 20
+  for o, a in opts:
+    if o in ('-h', '--help'):
+      logger.out(__doc__)
+      sys.exit(0)
+    if o in ('-t', '--tablename'):
+      tablename = a
+      if not re.match(r'^[_a-zA-Z][_a-zA-Z0-9]*$', tablename):
+        logger.err('invalid table name: %s' % tablename)
+        sys.exit(2)
+    if o in ('-m', '--measure'):
+      measure = a
+      if measure not in ('ll', 'chi2', 'tfidf'):
+        logger.err('measure not supported: %s' % measure)
+        sys.exit(2)
+    if o in ('-d', '--directories'):
+      by = 'directory'
+    if o in ('-n', '--number'):
+      try:
+        number = int(a)
+      except ValueError:
+        logger.err('invalid argument for number: %s' % a)
+        sys.exit(2)
+      if number <= 0:
+        logger.err('invalid number: %s' % number)
+        sys.exit(2)
+  names = [name.decode('utf-8') for name in args]
+  try:
+    db = database.Database(tablename)
+    with db:
+      start = time.time()
+      corpus = keyness.Corpus(db, by)
+      logger.out('loaded %d words in %d groups in %.3f s'
+          % (len(corpus.wids), len(corpus.labels), time.time() - start))
+      start = time.time()
+      if measure == 'll':
+        scores = corpus.log_likelihood()
+      elif measure == 'chi2':
+        scores = corpus.chi_squared()
+      else:
+        scores = corpus.tfidf()
+      logger.out('scored in %.3f s' % (time.time() - start))
+      # collect the top words of the selected groups
+      tops = []
+      for row, label in enumerate(corpus.labels):
+        if not names or [name for name in names if name in label]:
+          tops.append((label, corpus.top(scores, row, number)))
+      words = db.select_words(set(wid for label, top in tops for wid, score in top))
+  except sqlite3.Error as e:
+    logger.err('database error: %s' % e)
+    sys.exit(1)
+  for label, top in tops:
+    logger.out((u'\n%s:' % label).encode('utf-8'))
+    for wid, score in top:
+      word = words[wid]
+      line = u'%10.2f  %s (%s)' % (score, word[0],
+          u', '.join([pos for pos in word[1:] if pos != config.ALL]))
+      logger.out(line.encode('utf-8'))
+
+if __name__ == '__main__':
+  main()
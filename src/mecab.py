@@ -2,62 +2,353 @@
 """
 mecab.py: This file invokes the Mecab morphological analyser on the
 cleaned input files and parses its output, storing word information
-like pos and root and associating them with the sentences.
-Then it inserts these into the given database.
+like pos and root and associating them with the sentences. The results
+of recently parsed lines are cached, so that repeated lines are only
+tokenized once, optionally also across runs in a cache file.
 """
 
 import sys
+import os
 import re
+import time
+import hashlib
+import marshal
+import sqlite3
 import MeCab
 
 import config
+from cache import LRUCache
 from logger import logger
 
 class PyMeCab():
-  def __init__(self, sentences):
-    self.sentences = sentences
-    self.tagger = MeCab.Tagger('')
+  # output format for block parsing: byte offset, surface and features
+  node_format = r'%ps\t%m\t%H\n'
+  # version of the records of words, which are kept in cache files
+  record_version = 2
+
+  """
+  Creates the tagger. The results of the last config.parse_cache lines
+  are kept in memory, and if cachefile is given, all results are also
+  stored in that file.
+  """
+  def __init__(self, cachefile=None):
+    self.tagger = MeCab.Tagger('-F%s -U%s' % (self.node_format, self.node_format))
     self.fields = config.mecab_fields
+    self.blocksize = config.mecab_block
     # mecab has somtimes an error on the first parse, so test this before
     self.tagger.parseToNode(u'日本語'.encode('utf-8'))
+    self.cache = None
+    if config.parse_cache > 0 or cachefile:
+      self.cache = ParseCache(config.parse_cache, cachefile, self.stamp())
+    # lines and characters given to mecab, the time spent on parsing
+    # them and the part of it spent in mecab itself
+    self.counters = {'parsed_lines': 0, 'parsed_chars': 0,
+        'parsed_seconds': 0.0, 'mecab_seconds': 0.0, 'mecab_calls': 0}
+    # parsed features by feature string, and all distinct pos tuples
+    self.features = {}
+    self.pos_tuples = {}
+
+  """
+  Returns what the results of parsing depend on besides the text: the
+  files, versions and sizes of the dictionaries, the fields used and
+  the block size.
+  """
+  def stamp(self):
+    dictionaries = []
+    info = self.tagger.dictionary_info()
+    while info:
+      try:
+        mtime = os.stat(info.filename).st_mtime
+      except OSError:
+        mtime = None
+      dictionaries.append((info.filename, info.version, info.size, mtime))
+      info = info.next
+    return repr((dictionaries, self.fields, self.node_format,
+      self.record_version, self.blocksize))
+
+  """
+  Returns the counters as a dictionary: the numbers of lines and
+  characters given to mecab or found in the cache, the time spent on
+  parsing and how much and how often mecab itself was called.
+  """
+  def statistics(self):
+    statistics = dict(self.counters)
+    statistics['cached_lines'] = self.cache.hits if self.cache else 0
+    statistics['cached_chars'] = self.cache.hit_size if self.cache else 0
+    return statistics
 
-  def parse(self, line, db):
+  """ Writes new results to the cache file, if there is one. """
+  def flush(self):
+    if self.cache:
+      self.cache.flush()
+
+  """
+  Generates the words of each sentence in line as pairs of a list of
+  (root, pos0, ...) records and the sentence text. Records are shared
+  between words and must not be changed, see parse_feature.
+  """
+  def tokenize(self, line):
+    start = time.time()
     node = self.tagger.parseToNode(line.encode('utf-8'))
+    self.counters['mecab_seconds'] += time.time() - start
+    self.counters['mecab_calls'] += 1
+    features = self.features
     # accumulate words until end of stream or sentence
     while node:
       if node.stat == MeCab.MECAB_BOS_NODE:
-        sentence = u''
+        words = []
         data = []
       elif node.stat == MeCab.MECAB_NOR_NODE or node.stat == MeCab.MECAB_UNK_NODE:
         try:
           word = node.surface.decode('utf-8')
-          fields = node.feature.decode('utf-8').split(',')
-          # get part-of-speech features 
-          pos = fields[0:self.fields]
-          if fields[6] != u'*': # if root form is available, use it
-            root = fields[6] 
-          else:
-            root = word
-          sentence = sentence + word
-          data.append([root] + pos)
-          if pos[0] == u'記号' and pos[1] == u'句点' \
-            or pos[0] == u'記号' and word == u'！' \
-            or pos[0] == u'記号' and word == u'？':
-            self.insert(data, sentence, db)
-            sentence = u''
+          feature = node.feature.decode('utf-8')
+          parsed = features.get(feature)
+          if parsed == None:
+            parsed = self.parse_feature(feature)
+          record, pos = parsed
+          words.append(word)
+          data.append(record or (word,) + pos)
+          if self.ends_sentence(word, pos):
+            yield (data, u''.join(words))
+            words = []
             data = []
         except UnicodeDecodeError as e:
           logger.err('could not decode %s' % node.surface)
       elif node.stat == MeCab.MECAB_EOS_NODE:
-        self.insert(data, sentence, db)
+        yield (data, u''.join(words))
       node = node.next
 
-  def insert(self, data, sentence, db):
-    if self.sentences and sentence != '':
-      sid = db.insert_sentence(sentence)
-    for fieldvalues in data:
-      wid = db.insert_word(fieldvalues)
-      if self.sentences:
-        assert wid > 0 and sid > 0
-        db.insert_link(wid, sid)
+  """
+  Parses the features of a word and returns the pair (record, pos), where
+  pos is the tuple of its part-of-speech fields and record is the tuple
+  (root, pos0, ...), or None if the root is the word itself. Features and
+  pos tuples repeat all the time, so the results are kept and each
+  record and pos value exists only once, instead of once for every word.
+  """
+  def parse_feature(self, feature):
+    fields = feature.split(u',')
+    pos = tuple(fields[0:self.fields])
+    pos = self.pos_tuples.setdefault(pos, pos)
+    record = None
+    if fields[6] != u'*': # if root form is available, use it
+      record = (fields[6],) + pos
+    parsed = self.features[feature] = (record, pos)
+    return parsed
+
+  """
+  Generates the sentences of all lines like tokenize, but passes the
+  lines to mecab in blocks of about blocksize characters and reads
+  its text output instead of walking the nodes. With a cache, the lines
+  of a block are still parsed one by one, see parse_missing.
+  """
+  def tokenize_lines(self, lines):
+    if self.blocksize <= 0 and not self.cache:
+      for line in lines:
+        for record in self.tokenize(line):
+          yield record
+      return
+    block = []
+    size = 0
+    for line in lines:
+      block.append(line)
+      size = size + len(line)
+      if size >= max(self.blocksize, 1):
+        for records in self.parse_lines(block):
+          for record in records:
+            yield record
+        block = []
+        size = 0
+    if block:
+      for records in self.parse_lines(block):
+        for record in records:
+          yield record
+
+  """
+  Returns the sentences of each line as lists like the ones generated by
+  tokenize. Only lines which are not in the cache are given to mecab,
+  and each of them only once. The lists are shared with the cache and
+  must not be changed.
+  """
+  def parse_lines(self, lines):
+    if not self.cache:
+      return self.parse_missing(lines)
+    keys = [self.cache.key(line) for line in lines]
+    results = self.cache.get_all(keys)
+    missing = []
+    for key, line in zip(keys, lines):
+      if key not in results:
+        results[key] = None # parsed only once
+        missing.append((key, line))
+    if missing:
+      parsed = self.parse_missing([line for key, line in missing])
+      for (key, line), records in zip(missing, parsed):
+        results[key] = records
+        self.cache.put(key, records)
+    self.cache.hits = self.cache.hits + len(lines) - len(missing)
+    self.cache.hit_size = self.cache.hit_size + sum(len(line)
+      for line in lines) - sum(len(line) for key, line in missing)
+    return [results[key] for key in keys]
+
+  """
+  Parses lines which are not in the cache. Mecab finds the words of a
+  block in one lattice, so that they may depend on the lines around
+  them; results which are cached are parsed one line at a time, to be
+  the same whatever lines are next to them.
+  """
+  def parse_missing(self, lines):
+    start = time.time()
+    if self.blocksize <= 0:
+      results = [list(self.tokenize(line)) for line in lines]
+    elif self.cache:
+      results = [self.tokenize_block([line])[0] for line in lines]
+    else:
+      results = self.tokenize_block(lines)
+    counters = self.counters
+    counters['parsed_lines'] += len(lines)
+    counters['parsed_chars'] += sum(len(line) for line in lines)
+    counters['parsed_seconds'] += time.time() - start
+    return results
+
+  """ Parses lines at once, returning the sentences of each line. """
+  def tokenize_block(self, lines):
+    # join lines, remembering the byte offsets where each line ends
+    encoded = [line.replace(u'\n', u' ').encode('utf-8') for line in lines]
+    ends = []
+    end = 0
+    for line in encoded:
+      end = end + len(line) + 1
+      ends.append(end)
+    start = time.time()
+    output = self.tagger.parse('\n'.join(encoded))
+    self.counters['mecab_seconds'] += time.time() - start
+    self.counters['mecab_calls'] += 1
+    try:
+      entries = output.decode('utf-8').split(u'\n')
+    except UnicodeDecodeError:
+      entries = []
+      for entry in output.split('\n'):
+        try:
+          entries.append(entry.decode('utf-8'))
+        except UnicodeDecodeError:
+          logger.err('could not decode %s' % entry)
+    # accumulate words until end of line or sentence
+    features = self.features
+    results = [[] for line in lines]
+    line = 0
+    words = []
+    data = []
+    for entry in entries:
+      if entry == u'EOS':
+        break
+      start, word, feature = entry.split(u'\t', 2)
+      start = int(start)
+      while start >= ends[line]: # word is in a following line
+        results[line].append((data, u''.join(words)))
+        words = []
+        data = []
+        line = line + 1
+      parsed = features.get(feature)
+      if parsed == None:
+        parsed = self.parse_feature(feature)
+      record, pos = parsed
+      words.append(word)
+      data.append(record or (word,) + pos)
+      if self.ends_sentence(word, pos):
+        results[line].append((data, u''.join(words)))
+        words = []
+        data = []
+    # end the remaining lines
+    for line in range(line, len(ends)):
+      results[line].append((data, u''.join(words)))
+      words = []
+      data = []
+    return results
+
+  def ends_sentence(self, word, pos):
+    return pos[0] == u'記号' and (pos[1] == u'句点' \
+        or word == u'！' or word == u'？')
+
+"""
+Cache of the sentences of parsed lines, keyed by the SHA-1 hash of the
+line. The most recently used lines are kept in memory. If a file is
+given, all results are stored there as well, together with the stamp
+of the dictionaries and settings they were parsed with; the file is
+emptied when it was written with a different stamp.
+"""
+class ParseCache():
+  def __init__(self, size, filename, stamp):
+    self.memory = LRUCache(max(size, 0))
+    self.hits = 0
+    self.hit_size = 0
+    self.conn = None
+    self.pending = []
+    if filename:
+      self.open(filename, stamp)
+
+  def open(self, filename, stamp):
+    try:
+      # several processes may write to the file
+      self.conn = sqlite3.connect(filename, timeout=60)
+      self.conn.text_factory = str
+      c = self.conn.cursor()
+      c.execute('PRAGMA journal_mode = WAL')
+      c.execute('CREATE TABLE IF NOT EXISTS stamp (stamp TEXT)')
+      c.execute('CREATE TABLE IF NOT EXISTS parses (\
+          key BLOB PRIMARY KEY, records BLOB) WITHOUT ROWID')
+      c.execute('SELECT stamp FROM stamp')
+      row = c.fetchone()
+      if row == None or row[0] != stamp:
+        if row != None:
+          logger.out('dictionary changed, clearing parse cache %s' % filename)
+        c.execute('DELETE FROM stamp')
+        c.execute('DELETE FROM parses')
+        c.execute('INSERT INTO stamp VALUES (?)', (stamp,))
+      self.conn.commit()
+    except sqlite3.Error as e:
+      logger.err('could not open parse cache %s: %s' % (filename, e))
+      self.conn = None
+
+  def key(self, line):
+    return hashlib.sha1(line.encode('utf-8')).digest()
+
+  """ Returns the cached results of all keys found as a dictionary. """
+  def get_all(self, keys):
+    results = {}
+    unknown = set()
+    for key in keys:
+      if key in results or key in unknown:
+        continue
+      records = self.memory.get(key)
+      if records != None:
+        results[key] = records
+      else:
+        unknown.add(key)
+    if self.conn and unknown:
+      unknown = list(unknown)
+      c = self.conn.cursor()
+      # stay below the limit of sqlite variables
+      for i in range(0, len(unknown), 500):
+        chunk = unknown[i:i + 500]
+        c.execute('SELECT key, records FROM parses WHERE key IN (%s)'
+            % ','.join('?' * len(chunk)), [buffer(key) for key in chunk])
+        for key, records in c:
+          records = marshal.loads(str(records))
+          results[str(key)] = records
+          self.memory.put(str(key), records)
+    return results
+
+  def put(self, key, records):
+    self.memory.put(key, records)
+    if self.conn:
+      self.pending.append((buffer(key), buffer(marshal.dumps(records))))
 
+  def flush(self):
+    if not self.pending:
+      return
+    try:
+      self.conn.executemany('INSERT OR REPLACE INTO parses VALUES (?, ?)',
+          self.pending)
+      self.conn.commit()
+    except sqlite3.Error as e:
+      logger.err('could not write parse cache: %s' % e)
+    self.pending = []
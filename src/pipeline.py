@@ -0,0 +1,384 @@
+"""
+pipeline.py: This file connects the stages of the analysis. Files are
+read line by line by reader.py, the lines are cleaned by a formatter and
+tokenized by mecab, and the resulting sentences are passed on to a sink.
+All stages are generators, so only a small part of a file is kept in
+memory.
+"""
+
+import os
+import os.path
+import json
+import time
+import hashlib
+import itertools
+import multiprocessing
+
+import formats
+import mecab
+import reader
+import sketch
+import profiler
+from logger import logger
+
+def create_formatter(formatname):
+  if(formatname == 'aozora'):
+    return formats.AozoraFormat()
+  elif(formatname == 'html'):
+    return formats.HTMLFormat()
+  else:
+    return formats.Format()
+
+def list_files(args, recursive):
+  if recursive:
+    for dirname in args:
+      for dirpath, dirs, files in os.walk(dirname):
+        logger.out('going through directory %s' % dirpath)
+        for filename in files:
+          yield os.path.join(dirpath, filename)
+  else:
+    for filename in args:
+      yield filename
+
+def trim_lines(lines, formatter):
+  formatter.new_file()
+  for line in lines:
+    yield formatter.trim(line)
+
+"""
+Generates the sentences of a file as pairs of a list of
+(root, pos0, ...) records and the sentence text. If metrics is given,
+the stages are timed and the sentences counted in it, see profiler.py.
+"""
+def tokenize(filename, formatter, parser, encoding, metrics=None):
+  lines = reader.read_lines(filename, encoding)
+  if metrics == None:
+    return parser.tokenize_lines(trim_lines(lines, formatter))
+  lines = profiler.timed(lines, metrics, 'read')
+  lines = profiler.timed(trim_lines(lines, formatter), metrics, 'format')
+  records = profiler.timed(parser.tokenize_lines(lines), metrics, 'tokenize')
+  return profiler.counted(records, metrics)
+
+""" Writes records to sink, adding the time it takes to metrics. """
+def write_timed(sink, records, metrics):
+  seconds = 0.0
+  calls = 0
+  clock = time.time
+  for data, sentence in records:
+    start = clock()
+    sink.write(data, sentence)
+    seconds = seconds + clock() - start
+    calls = calls + 1
+  profiler.add(metrics, {'store_seconds': seconds, 'store_calls': calls})
+
+""" Generates the bigrams and trigrams of the roots of the words of a
+sentence as keys (w1, w2, w3), where w3 is empty for bigrams. """
+def ngrams(data):
+  for i in range(len(data) - 1):
+    yield (data[i][0], data[i + 1][0], u'')
+    if i + 2 < len(data):
+      yield (data[i][0], data[i + 1][0], data[i + 2][0])
+
+"""
+Analyses all files and writes their sentences to sink. With more than
+one job, files are tokenized in worker processes, but the results are
+still written to the sink in the same order from this process. Parsed
+lines are also kept in cachefile if it is given, see mecab.py. If
+profile is given, the metrics of each file are passed to it, see
+profiler.py; with more than one job, only storing the results is
+profiled with cProfile.
+"""
+def run(filenames, formatname, encoding, jobs, sink, cachefile=None,
+    profile=None):
+  statistics = {}
+  if jobs > 1:
+    filenames = [filename for filename in filenames if sink.wanted(filename)]
+    pool = multiprocessing.Pool(jobs, init_worker,
+        (formatname, encoding, sink.sentences, sink.ngrams, sink.word_buffer,
+          cachefile, profile != None))
+    for filename, (result, metrics) in itertools.izip(filenames,
+        pool.imap(work, filenames)):
+      if profile:
+        profile.begin_file(filename)
+      start = time.time()
+      sink.begin_file(filename)
+      if sink.sentences:
+        for data, sentence in result:
+          sink.write(data, sentence)
+      else:
+        for counts in result[0]:
+          sink.add_counts(counts)
+        if sink.ngrams:
+          sink.add_ngrams(result[1])
+      sink.end_file()
+      profiler.add(statistics, metrics)
+      if profile:
+        metrics['store_seconds'] = time.time() - start
+        profile.end_file(filename, metrics)
+    pool.close()
+    pool.join()
+  else:
+    formatter = create_formatter(formatname)
+    parser = mecab.PyMeCab(cachefile)
+    for filename in filenames:
+      if not sink.wanted(filename):
+        continue
+      before = parser.statistics()
+      metrics = {}
+      if profile:
+        profile.begin_file(filename)
+      sink.begin_file(filename)
+      if profile:
+        write_timed(sink, tokenize(filename, formatter, parser, encoding,
+          metrics), metrics)
+      else:
+        for data, sentence in tokenize(filename, formatter, parser, encoding):
+          sink.write(data, sentence)
+      start = time.time()
+      parser.flush()
+      sink.end_file()
+      if profile:
+        metrics['store_seconds'] += time.time() - start
+      profiler.finish_stages(metrics, parser, before)
+      profiler.add(statistics, metrics)
+      if profile:
+        profile.end_file(filename, metrics)
+  report_statistics(statistics)
+
+"""
+Logs how many lines were found in the parse cache, and about how much
+time that saved, given the time mecab took for the characters of the
+other lines.
+"""
+def report_statistics(statistics):
+  hits = statistics.get('cached_lines', 0)
+  lines = hits + statistics.get('parsed_lines', 0)
+  if hits == 0:
+    return
+  message = 'found %d of %d lines in the parse cache (%.1f%%)' \
+      % (hits, lines, 100.0 * hits / lines)
+  if statistics['parsed_chars'] > 0:
+    message = message + ', saving about %.2f s of tokenizing' \
+        % (statistics['parsed_seconds'] * statistics['cached_chars']
+          / statistics['parsed_chars'])
+  logger.out(message)
+
+# formatter, parser, encoding, sentence and n-gram mode, word buffer and
+# whether to profile of a worker process
+worker = None
+
+def init_worker(formatname, encoding, sentences, ngrams, word_buffer,
+    cachefile, profiling):
+  global worker
+  worker = (create_formatter(formatname), mecab.PyMeCab(cachefile), encoding,
+      sentences, ngrams, word_buffer, profiling)
+
+"""
+Tokenizes a whole file in a worker process. If sentences are needed,
+they are returned in order, otherwise only a list of word counts split
+like the sink would flush them, see CounterSink, and the n-gram counts,
+together with the metrics of the parser and, when profiling, of the
+stages for this file.
+"""
+def work(filename):
+  formatter, parser, encoding, sentences, ngrams, word_buffer, profiling \
+      = worker
+  before = parser.statistics()
+  metrics = {}
+  records = tokenize(filename, formatter, parser, encoding,
+      metrics if profiling else None)
+  if sentences:
+    result = [(data, sentence) for data, sentence in records if data]
+  else:
+    sink = CounterSink(ngrams, word_buffer)
+    for data, sentence in records:
+      sink.write(data, sentence)
+    result = (sink.pieces + [sink.counts], sink.ngram_counts)
+  parser.flush()
+  return (result, profiler.finish_stages(metrics, parser, before))
+
+""" Returns size, modification time and SHA-1 hash of a file. """
+def file_signature(filename):
+  stat = os.stat(filename)
+  digest = hashlib.sha1()
+  with open(filename, 'rb') as fp:
+    for chunk in iter(lambda: fp.read(1 << 20), ''):
+      digest.update(chunk)
+  return (stat.st_size, stat.st_mtime, digest.hexdigest())
+
+"""
+Sinks receive the sentences with write and word counts collected
+elsewhere with add_counts. The attribute sentences tells if the sink
+needs the sentences themselves or if word counts are sufficient, and
+ngrams if it counts n-grams, which are collected with add_ngrams.
+If word_buffer is set, counts are added in pieces of that many distinct
+words, the way the sink flushes them itself. Sinks are told when a file
+begins and ends, and may decline to receive a file at all.
+"""
+class Sink():
+  sentences = False
+  ngrams = False
+  word_buffer = 0
+
+  def wanted(self, filename):
+    return True
+
+  def begin_file(self, filename):
+    pass
+
+  def end_file(self):
+    pass
+
+""" Stores the results in the database, keeping a manifest of analysed
+files so that unchanged files are skipped when analysed again. """
+class DatabaseSink(Sink):
+  def __init__(self, db, sentences, ngrams=False):
+    self.db = db
+    self.sentences = sentences
+    self.ngrams = ngrams
+    self.word_buffer = db.word_buffer
+    self.signatures = {}
+
+  def wanted(self, filename):
+    path = os.path.abspath(filename)
+    try:
+      stat = os.stat(path)
+    except OSError:
+      return True # reported when reading
+    row = self.db.select_file(path)
+    if row != None:
+      did, size, mtime, digest, committed = row
+      if committed and size == stat.st_size and mtime == stat.st_mtime:
+        logger.out('skipping unchanged %s' % filename)
+        return False
+    try:
+      signature = file_signature(path)
+    except IOError as e:
+      logger.err('error opening %s: %s' % (filename, e))
+      return False
+    if row != None and committed and digest == signature[2]:
+      logger.out('skipping unchanged %s' % filename)
+      self.db.update_file(did, signature[0], signature[1])
+      return False
+    self.signatures[path] = signature
+    return True
+
+  def begin_file(self, filename):
+    path = os.path.abspath(filename)
+    if path in self.signatures:
+      self.db.begin_document(path, *self.signatures.pop(path))
+
+  def end_file(self):
+    if self.db.did != None:
+      self.db.end_document()
+
+  def write(self, data, sentence):
+    db = self.db
+    if self.ngrams:
+      db.count_ngrams(ngrams(data))
+    if not self.sentences:
+      # word ids are not needed, so counts can be accumulated
+      for fieldvalues in data:
+        db.count_word(fieldvalues)
+      db.checkpoint()
+      return
+    if not data:
+      return
+    sid, new = db.insert_sentence(sentence)
+    wids = set()
+    for fieldvalues in data:
+      wids.add(db.insert_word(fieldvalues))
+    if new:
+      assert sid > 0
+      db.insert_links(wids, sid, len(sentence))
+    db.checkpoint()
+
+  def add_counts(self, counts):
+    self.db.add_counts(counts)
+
+  def add_ngrams(self, counts):
+    self.db.add_ngrams(counts)
+
+"""
+Counts words and n-grams in memory. Once the counts hold more than
+word_buffer distinct words, they are put aside in pieces and counting
+starts over, so that adding the pieces to a database flushes the same
+words together as counting there would, and the words get the same ids.
+"""
+class CounterSink(Sink):
+  def __init__(self, ngrams=False, word_buffer=0):
+    self.sentences = False
+    self.ngrams = ngrams
+    self.word_buffer = word_buffer
+    self.counts = {}
+    self.pieces = []
+    self.ngram_counts = {}
+
+  def write(self, data, sentence):
+    counts = self.counts
+    for fieldvalues in data:
+      key = tuple(fieldvalues)
+      if key in counts:
+        counts[key] += 1
+      else:
+        counts[key] = 1
+        if len(counts) > self.word_buffer > 0:
+          self.pieces.append(counts)
+          counts = self.counts = {}
+    if self.ngrams:
+      counts = self.ngram_counts
+      for key in ngrams(data):
+        counts[key] = counts.get(key, 0) + 1
+
+  def add_counts(self, counts):
+    own = self.counts
+    for key, n in counts.iteritems():
+      own[key] = own.get(key, 0) + n
+
+"""
+Counts the words approximately in bounded memory, see sketch.py. At the
+end, only the size most frequent words are added to the database.
+Files are not recorded in the manifest, as their counts are not kept.
+"""
+class ApproximateSink(Sink):
+  def __init__(self, db, size):
+    self.db = db
+    self.sentences = False
+    self.counter = sketch.HeavyHitters(size)
+
+  def write(self, data, sentence):
+    add = self.counter.add
+    for fieldvalues in data:
+      add(tuple(fieldvalues))
+
+  def add_counts(self, counts):
+    add = self.counter.add
+    for key, n in counts.iteritems():
+      add(key, n)
+
+  def finish(self):
+    self.db.add_counts(dict(self.counter.top()))
+
+""" Writes every sentence with its words as one line of JSON. """
+class JSONSink(Sink):
+  def __init__(self, fp):
+    self.fp = fp
+    self.sentences = True
+
+  def write(self, data, sentence):
+    if data:
+      self.fp.write(json.dumps({'sentence': sentence, 'words': data},
+          ensure_ascii=False))
+      self.fp.write(u'\n')
+
+""" Discards everything, only counting the words. """
+class NullSink(Sink):
+  def __init__(self):
+    self.sentences = False
+    self.words = 0
+
+  def write(self, data, sentence):
+    self.words = self.words + len(data)
+
+  def add_counts(self, counts):
+    self.words = self.words + sum(counts.itervalues())
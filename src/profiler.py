@@ -0,0 +1,159 @@
+"""
+profiler.py: This file measures where the analysis spends its time. The
+time and calls of each stage of the pipeline are summed up per file,
+together with the amount of text passing through, and reported for
+each file, periodically for all files and at the end, when they are
+also written as JSON to compare runs of different versions. The
+slowest files can be profiled with cProfile as well.
+"""
+
+import os
+import time
+import json
+import heapq
+import cProfile
+
+import config
+from logger import logger
+
+# stages of the pipeline in order: decoding the input, removing the
+# formatting, mecab itself, parsing its output and storing the results
+stages = ('read', 'format', 'mecab', 'parse', 'store')
+
+""" Adds the metrics in other to those in metrics and returns them. """
+def add(metrics, other):
+  for key, value in other.iteritems():
+    metrics[key] = metrics.get(key, 0) + value
+  return metrics
+
+"""
+Generates the items of iterable, adding the time spent waiting for each
+of them to metrics[stage + '_seconds'] and their number to
+metrics[stage + '_calls']. If iterable is a generator reading from
+another timed one, the time includes that of the other stage.
+"""
+def timed(iterable, metrics, stage):
+  seconds = 0.0
+  calls = 0
+  clock = time.time
+  iterator = iter(iterable)
+  try:
+    while True:
+      start = clock()
+      try:
+        item = next(iterator)
+      finally:
+        seconds = seconds + clock() - start
+      calls = calls + 1
+      yield item
+  except StopIteration:
+    pass
+  finally:
+    add(metrics, {stage + '_seconds': seconds, stage + '_calls': calls})
+
+""" Generates the sentences of records, counting them and their words
+in metrics. """
+def counted(records, metrics):
+  sentences = 0
+  tokens = 0
+  for data, sentence in records:
+    if data:
+      sentences = sentences + 1
+      tokens = tokens + len(data)
+    yield (data, sentence)
+  add(metrics, {'sentences': sentences, 'tokens': tokens})
+
+"""
+Turns the times of nested stages into the time of each stage alone:
+format includes read, and tokenize includes format, mecab and parse.
+before are the statistics of the parser at the start of the file.
+"""
+def finish_stages(metrics, parser, before):
+  after = parser.statistics()
+  for key in after:
+    metrics[key] = metrics.get(key, 0) + after[key] - before[key]
+  if 'tokenize_seconds' in metrics:
+    tokenize = metrics.pop('tokenize_seconds') - metrics['format_seconds']
+    metrics['format_seconds'] -= metrics['read_seconds']
+    metrics['parse_seconds'] = tokenize - metrics['mecab_seconds']
+    metrics['parse_calls'] = metrics.pop('tokenize_calls')
+  return metrics
+
+"""
+Collects the metrics of all files. The metrics are written as JSON to
+filename at the end, and the slowest files are profiled with cProfile
+and their statistics written next to it.
+"""
+class Profile():
+  def __init__(self, filename, slowest=0):
+    self.filename = filename
+    self.slowest = slowest
+    self.files = []
+    self.total = {}
+    self.start = time.time()
+    self.last_report = self.start
+    # heap of the slowest files as (seconds, filename, profile)
+    self.profiles = []
+    self.profile = None
+
+  def begin_file(self, filename):
+    if self.slowest > 0:
+      self.profile = cProfile.Profile()
+      self.profile.enable()
+
+  def end_file(self, filename, metrics):
+    seconds = sum(metrics.get(stage + '_seconds', 0) for stage in stages)
+    if self.profile:
+      self.profile.disable()
+      entry = (seconds, filename, self.profile)
+      if len(self.profiles) < self.slowest:
+        heapq.heappush(self.profiles, entry)
+      else:
+        heapq.heappushpop(self.profiles, entry)
+      self.profile = None
+    try:
+      metrics['bytes'] = os.path.getsize(filename)
+    except OSError:
+      metrics['bytes'] = 0
+    metrics['files'] = 1
+    self.files.append((filename, metrics))
+    add(self.total, metrics)
+    logger.out(self.summary(filename, metrics))
+    if time.time() - self.last_report >= config.profile_interval:
+      logger.out(self.summary('so far', self.total))
+      self.last_report = time.time()
+
+  """ Returns a line with the throughput and time of each stage. """
+  def summary(self, name, metrics):
+    seconds = sum(metrics.get(stage + '_seconds', 0) for stage in stages)
+    times = ', '.join('%s %.2f' % (stage, metrics.get(stage + '_seconds', 0))
+        for stage in stages)
+    return '%s: %.2f MB, %d tokens, %d sentences in %.2f s ' \
+        '(%.0f tokens/s, %.2f MB/s; %s s)' % (name,
+          metrics.get('bytes', 0) / 1e6, metrics.get('tokens', 0),
+          metrics.get('sentences', 0), seconds,
+          metrics.get('tokens', 0) / max(seconds, 1e-6),
+          metrics.get('bytes', 0) / 1e6 / max(seconds, 1e-6), times)
+
+  """ Reports the totals and writes all metrics and profiles. """
+  def finish(self):
+    wall = time.time() - self.start
+    logger.out(self.summary('all files', self.total))
+    logger.out('%.2f s in total' % wall)
+    result = {'stages': stages, 'wall_seconds': wall, 'total': self.total,
+        'files': [dict(metrics, file=filename.decode('utf-8', 'replace'))
+          for filename, metrics in self.files]}
+    try:
+      with open(self.filename, 'w') as fp:
+        json.dump(result, fp, indent=1, sort_keys=True)
+        fp.write('\n')
+    except IOError as e:
+      logger.err('could not write profile: %s' % e)
+      return
+    logger.out('wrote profile to %s' % self.filename)
+    for rank, (seconds, filename, profile) in enumerate(
+        sorted(self.profiles, reverse=True)):
+      name = '%s.%d.prof' % (self.filename, rank + 1)
+      profile.dump_stats(name)
+      logger.out('wrote cProfile statistics of %s (%.2f s) to %s'
+          % (filename, seconds, name))
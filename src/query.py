@@ -0,0 +1,124 @@
+"""
+query.py: This file runs the queries of the frequency browser in a
+background thread with its own database connection, so that the
+interface stays responsive. Results are passed back to the GTK main
+loop, and queries which are superseded by newer ones are cancelled.
+"""
+
+import threading
+import Queue
+import sqlite3
+
+import gobject
+
+from logger import logger
+
+"""
+Thread executing queries on a database one after another. Each query
+is submitted on a channel, and a newer query on the same channel
+supersedes the older one: it is skipped if it has not started yet, and
+interrupted otherwise. Only the latest result of a channel is delivered.
+"""
+class QueryThread(threading.Thread):
+  def __init__(self, db):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.db = db
+    self.requests = Queue.Queue()
+    # latest query number of each channel, and the running query
+    self.lock = threading.Lock()
+    self.numbers = {}
+    self.running = None
+    # connection state, set once the database is opened
+    self.ready = threading.Event()
+    self.error = None
+    # channels waiting for a result, only used by the main loop
+    self.waiting = set()
+
+  """ Starts the thread and waits until the database is opened,
+  raising the error if that failed. """
+  def start(self):
+    threading.Thread.start(self)
+    self.ready.wait()
+    if self.error != None:
+      raise self.error
+
+  def run(self):
+    try:
+      self.db.__enter__()
+    except sqlite3.Error as e:
+      self.error = e
+      self.ready.set()
+      return
+    self.ready.set()
+    try:
+      while True:
+        request = self.requests.get()
+        if request == None:
+          break
+        self.execute(*request)
+    finally:
+      self.db.__exit__(None, None, None)
+
+  def execute(self, channel, number, query, callback):
+    with self.lock:
+      if self.numbers[channel] != number:
+        return # superseded before it started
+      self.running = channel
+    try:
+      result = query(self.db)
+    except Exception as e:
+      # any error has to reach the callback, or the query would never end
+      with self.lock:
+        self.running = None
+        if self.numbers[channel] != number:
+          return # interrupted
+      if isinstance(e, sqlite3.Error):
+        logger.err('database error: %s' % e)
+      else:
+        logger.err('query error: %s: %s' % (type(e).__name__, e))
+      gobject.idle_add(self.deliver, channel, number, callback, None, e)
+      return
+    with self.lock:
+      self.running = None
+    gobject.idle_add(self.deliver, channel, number, callback, result, None)
+
+  """ Called from the main loop with the result or error of a query. """
+  def deliver(self, channel, number, callback, result, error):
+    if self.numbers.get(channel) == number:
+      self.waiting.discard(channel)
+      callback(result, error)
+    return False # run only once
+
+  """
+  Submits query, a function called with the database, on channel and
+  cancels the previous query of that channel. callback is called from
+  the main loop with the result and None, or with None and the
+  exception if the query failed.
+  """
+  def submit(self, channel, query, callback):
+    number = self.cancel(channel)
+    self.waiting.add(channel)
+    self.requests.put((channel, number, query, callback))
+
+  """ Cancels the query of channel and returns a new query number for it. """
+  def cancel(self, channel):
+    with self.lock:
+      number = self.numbers.get(channel, 0) + 1
+      self.numbers[channel] = number
+      if self.running == channel:
+        self.db.conn.interrupt()
+    self.waiting.discard(channel)
+    return number
+
+  def busy(self):
+    return len(self.waiting) > 0
+
+  def stop(self):
+    with self.lock:
+      for channel in self.numbers:
+        self.numbers[channel] = self.numbers[channel] + 1
+      if self.running != None:
+        self.db.conn.interrupt()
+    self.requests.put(None)
+    self.join()
@@ -0,0 +1,99 @@
+"""
+reader.py: This file reads the lines of input files. Files are memory
+mapped and decoded in large chunks, their encoding is detected unless
+it is given, and text files in zip archives, in which Aozora Bunko
+distributes its texts, are read without extracting them.
+"""
+
+import os
+import mmap
+import codecs
+import zipfile
+
+from logger import logger
+
+# size of the chunks which are decoded at once
+chunk_size = 1 << 20
+# number of bytes examined to detect the encoding
+probe_size = 4096
+# encodings tried in this order; the probe rejects Shift_JIS text as
+# EUC-JP, but not the other way round
+probe_encodings = ('utf-8', 'euc_jp', 'cp932')
+boms = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'))
+
+"""
+Generates the lines of the file or, for a zip archive, of the text files
+in it. The encoding is detected for each file if it is 'auto'.
+"""
+def read_lines(filename, encoding):
+  try:
+    if zipfile.is_zipfile(filename):
+      for line in read_archive(filename, encoding):
+        yield line
+      return
+    fp = open(filename, 'rb')
+  except (IOError, zipfile.BadZipfile) as e:
+    logger.err('error opening %s: %s' % (filename, e))
+    return
+  with fp:
+    if os.fstat(fp.fileno()).st_size == 0:
+      return # empty files cannot be mapped
+    data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      encoding = detect_encoding(data, encoding)
+      logger.out('reading %s (%s)' % (filename, encoding))
+      for line in decode_lines(data, encoding, filename):
+        yield line
+    finally:
+      data.close()
+
+def read_archive(filename, encoding):
+  with zipfile.ZipFile(filename) as archive:
+    for name in archive.namelist():
+      if not name.lower().endswith('.txt'):
+        continue
+      data = archive.read(name)
+      member_encoding = detect_encoding(data, encoding)
+      logger.out('reading %s in %s (%s)' % (name, filename, member_encoding))
+      for line in decode_lines(data, member_encoding, filename):
+        yield line
+
+""" Returns encoding, or if it is 'auto', the encoding of data as
+given by its byte order mark or found by decoding its beginning. """
+def detect_encoding(data, encoding):
+  if encoding != 'auto':
+    return encoding
+  start = data[:probe_size]
+  for bom, name in boms:
+    if start.startswith(bom):
+      return name
+  for name in probe_encodings:
+    # a character may be cut off at the end of the probe
+    decoder = codecs.getincrementaldecoder(name)()
+    try:
+      decoder.decode(start, len(data) <= probe_size)
+    except UnicodeDecodeError:
+      continue
+    return name
+  return 'cp932'
+
+""" Generates the lines of data, decoding it in chunks of chunk_size
+bytes. Line ends are kept, like when iterating over a codecs file. """
+def decode_lines(data, encoding, filename):
+  decoder = codecs.getincrementaldecoder(encoding)('replace')
+  rest = u''
+  errors = False
+  for start in range(0, len(data), chunk_size):
+    end = start + chunk_size
+    text = decoder.decode(data[start:end], end >= len(data))
+    if not errors and u'\ufffd' in text:
+      logger.err('could not decode parts of %s as %s' % (filename, encoding))
+      errors = True
+    lines = (rest + text).splitlines(True)
+    # the last line may continue in the next chunk
+    rest = lines.pop() if lines else u''
+    for line in lines:
+      yield line
+  if rest:
+    yield rest
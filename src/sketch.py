@@ -0,0 +1,49 @@
+"""
+sketch.py: This file defines a counter for the most frequent items of
+a stream in bounded memory, for counting words in corpora too large to
+count exactly.
+"""
+
+import heapq
+
+"""
+Counts the frequent items of a stream with at most 2 * size counters,
+using the Misra-Gries algorithm, which is the counterpart of
+Space-Saving: whenever there are too many counters, the (size + 1)-th
+largest count is subtracted from all counts, dropping at least half of
+the counters. The sum of these subtractions is kept in error.
+
+Each count is at most error lower than the exact count of its item, and
+never higher. An item without a counter occurred at most error times.
+As every subtraction removes at least size + 1 times its value from
+the total, error is at most total / (size + 1), so for all items
+occurring more often than that, the counts are guaranteed.
+"""
+class HeavyHitters():
+  def __init__(self, size):
+    self.size = size
+    self.counts = {}
+    self.total = 0
+    self.error = 0
+
+  def add(self, key, n=1):
+    counts = self.counts
+    if key in counts:
+      counts[key] += n
+    else:
+      counts[key] = n
+      if len(counts) > 2 * self.size:
+        self.reduce()
+    self.total += n
+
+  def reduce(self):
+    m = heapq.nlargest(self.size + 1, self.counts.itervalues())[-1]
+    self.counts = dict((key, n - m) for key, n in self.counts.iteritems()
+        if n > m)
+    self.error += m
+
+  """ Returns the size largest counts as a list of (key, count) pairs,
+  largest first. """
+  def top(self):
+    return heapq.nlargest(self.size, self.counts.iteritems(),
+        key=lambda item: item[1])
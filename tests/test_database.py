@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+test_database.py: This file tests the database on a small table built
+from a synthetic text with the stub tagger, so that neither MeCab nor
+real novels are needed. Run it from the top directory with
+python2 -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+  os.pardir, 'src'))
+
+# the stub has to be in place before mecab is imported
+from benchmark import stubtagger
+sys.modules['MeCab'] = stubtagger
+
+import config
+import database
+import pipeline
+from logger import logger
+from benchmark import synthetic
+
+"""
+Sets up a temporary database and a synthetic text, and builds tables
+from it with the analyser pipeline.
+"""
+class DatabaseTest(unittest.TestCase):
+  def setUp(self):
+    self.verbosity = logger.verbosity
+    logger.verbosity = -1
+    self.dbfile = config.dbfile
+    self.workdir = tempfile.mkdtemp(prefix='test')
+    config.dbfile = os.path.join(self.workdir, 'test.db')
+    self.filename = os.path.join(self.workdir, 'text.txt')
+    synthetic.Generator(0).write(self.filename, 20000)
+
+  def tearDown(self):
+    config.dbfile = self.dbfile
+    logger.verbosity = self.verbosity
+    shutil.rmtree(self.workdir)
+
+  """ Analyses filenames into the tables of db, which has to be
+  connected. """
+  def ingest(self, db, filenames, sentences=True, jobs=1, sink=None):
+    db.create_table(False)
+    db.begin_ingest()
+    if sink == None:
+      sink = pipeline.DatabaseSink(db, sentences)
+    pipeline.run(filenames, 'aozora', 'auto', jobs, sink)
+    db.end_ingest()
+
+  """ Returns the frequencies of a table by word and pos values. """
+  def frequencies(self, db):
+    db.c.execute(u'SELECT freq, %s FROM %s'
+        % (u', '.join(db.fieldnames), db.freq_table))
+    return dict((row[1:], row[0]) for row in db.c.fetchall())
+
+class QueryPlanTest(DatabaseTest):
+  def test_queries_are_indexed(self):
+    db = database.Database('test')
+    with db:
+      self.ingest(db, [self.filename])
+      db.c.execute(u'SELECT count(*) FROM %s' % db.link_table)
+      self.assertTrue(db.c.fetchone()[0] > 0)
+      self.assertEqual(db.check_query_plans(), [])
+
+""" Sink stopping the analysis like an interrupt after limit sentences. """
+class InterruptedSink(pipeline.DatabaseSink):
+  def __init__(self, db, sentences, limit):
+    pipeline.DatabaseSink.__init__(self, db, sentences)
+    self.limit = limit
+
+  def write(self, data, sentence):
+    if self.limit == 0:
+      raise KeyboardInterrupt()
+    self.limit = self.limit - 1
+    pipeline.DatabaseSink.write(self, data, sentence)
+
+class IngestTest(DatabaseTest):
+  def test_resume_after_interrupt(self):
+    db = database.Database('test')
+    with self.assertRaises(KeyboardInterrupt):
+      with db:
+        self.ingest(db, [self.filename], sink=InterruptedSink(db, True, 300))
+    db = database.Database('test')
+    with db:
+      self.ingest(db, [self.filename])
+      resumed = self.frequencies(db)
+      db.c.execute(u'SELECT sum(freq) FROM %s' % db.docfreq_table)
+      self.assertEqual(db.c.fetchone()[0], sum(resumed.values()))
+    fresh = database.Database('fresh')
+    with fresh:
+      self.ingest(fresh, [self.filename])
+      self.assertEqual(resumed, self.frequencies(fresh))
+
+  def test_jobs_match_serial(self):
+    filenames = [self.filename]
+    for seed in (1, 2):
+      filenames.append(os.path.join(self.workdir, 'text%d.txt' % seed))
+      synthetic.Generator(seed).write(filenames[-1], 20000)
+    rows = []
+    for tablename, jobs in (('serial', 1), ('parallel', 2)):
+      db = database.Database(tablename)
+      # flush in several batches per file
+      db.word_buffer = 50
+      with db:
+        self.ingest(db, filenames, sentences=False, jobs=jobs)
+        db.c.execute(u'SELECT wid, freq, %s FROM %s ORDER BY wid'
+            % (u', '.join(db.fieldnames), db.freq_table))
+        freqs = db.c.fetchall()
+        db.c.execute(u'SELECT did, wid, freq FROM %s ORDER BY did, wid'
+            % db.docfreq_table)
+        rows.append((freqs, db.c.fetchall()))
+    self.assertTrue(rows[0][0])
+    self.assertEqual(rows[0], rows[1])
+
+class SearchTest(DatabaseTest):
+  def test_terms_match_case(self):
+    lines = synthetic.Generator(0).text(20000)
+    # before the postscript, which is not analysed
+    lines[-10:-10] = [u'　ABCDの話。', u'　abcdの話。']
+    with open(self.filename, 'wb') as fp:
+      for line in lines:
+        fp.write((line + u'\r\n').encode('cp932'))
+    db = database.Database('test')
+    with db:
+      self.ingest(db, [self.filename])
+      for text in (u'ABC', u'abc', u'AB', u'ab', u'ABC の'):
+        found = [row[0] for row in db.select_search_page(text, 100)]
+        self.assertTrue(found)
+        for term in text.split():
+          self.assertTrue(all(term in sentence for sentence in found))
+
+if __name__ == '__main__':
+  unittest.main()